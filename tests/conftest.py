@@ -0,0 +1,29 @@
+import os
+
+import pytest
+
+# A randomly initialized Llama small enough to trace on a CPU in seconds.
+# Override via WORKBENCH_TEST_MODEL.
+TEST_MODEL = os.environ.get(
+    "WORKBENCH_TEST_MODEL", "hf-internal-testing/tiny-random-LlamaForCausalLM"
+)
+
+
+@pytest.fixture(scope="session")
+def tiny_model():
+    """A dispatched float32 ``StandardizedTransformer`` for ``TEST_MODEL``.
+
+    Skips when nnterp is missing or the checkpoint can't be fetched.
+    """
+    nnterp = pytest.importorskip("nnterp")
+    torch = pytest.importorskip("torch")
+
+    try:
+        model = nnterp.StandardizedTransformer(
+            TEST_MODEL, device_map="cpu", torch_dtype=torch.float32
+        )
+    except OSError as e:
+        pytest.skip(f"{TEST_MODEL} unavailable: {e}")
+
+    model.dispatch()
+    return model
@@ -0,0 +1,157 @@
+"""The batched patch sweeps against an unbatched, one-trace-per-cell reference.
+
+Each sweep starts from an empty baseline cache, so its clean passes run
+through ``clean_baselines``; a second run then takes them from the cache.
+"""
+
+import pytest
+
+t = pytest.importorskip("torch")
+pytest.importorskip("nnsight")
+pytest.importorskip("nnsightful")
+
+from workbench._api.patching import compute_ioi_metric, get_prob, logit_difference  # noqa: E402
+from workbench._api.routes.patch import (  # noqa: E402
+    PatchRequest,
+    patch_components,
+    patch_heads,
+    patch_positions,
+)
+
+# Same token count, so whole-sequence patches line up.
+SOURCE = "When Mary and John went to the store, John gave a drink to"
+DESTINATION = "When Mary and John went to the store, Mary gave a drink to"
+
+CORRECT_ID = 5
+INCORRECT_ID = 7
+
+MAX_BATCH = 3
+
+
+def make_request(submodule: str, incorrect_id: int | None) -> PatchRequest:
+    return PatchRequest(
+        model="test",
+        source=SOURCE,
+        destination=DESTINATION,
+        edits=[],
+        submodule=submodule,
+        patchTokens=False,
+        correctId=CORRECT_ID,
+        incorrectId=incorrect_id,
+    )
+
+
+def clean_diffs(model, incorrect_id):
+    if incorrect_id is None:
+        return None, None
+
+    with model.trace(SOURCE):
+        source_diff = logit_difference(model, CORRECT_ID, incorrect_id).save()
+    with model.trace(DESTINATION):
+        destination_diff = logit_difference(model, CORRECT_ID, incorrect_id).save()
+
+    return source_diff, destination_diff
+
+
+def patched_metric(model, incorrect_id, diffs):
+    if incorrect_id is None:
+        return get_prob(model, CORRECT_ID)
+
+    return compute_ioi_metric(*diffs, logit_difference(model, CORRECT_ID, incorrect_id))
+
+
+def run_twice(sweep, *args, **kwargs):
+    """Run ``sweep`` with an empty baseline, then again from what it cached."""
+    baseline = {}
+    first = sweep(*args, max_batch=MAX_BATCH, baseline=baseline, **kwargs)
+
+    assert {"source_logits", "clean_outputs", "destination_logits"} <= baseline.keys()
+
+    second = sweep(*args, max_batch=MAX_BATCH, baseline=baseline, **kwargs)
+    return first, second
+
+
+@pytest.fixture(autouse=True)
+def no_grad():
+    with t.no_grad():
+        yield
+
+
+@pytest.fixture(scope="module")
+def model(tiny_model):
+    n_tokens = [len(tiny_model.tokenizer.encode(prompt)) for prompt in (SOURCE, DESTINATION)]
+    assert n_tokens[0] == n_tokens[1]
+    return tiny_model
+
+
+@pytest.mark.parametrize("incorrect_id", [INCORRECT_ID, None])
+def test_patch_components(model, incorrect_id):
+    n_layers = model.num_layers
+    diffs = clean_diffs(model, incorrect_id)
+
+    with model.trace(SOURCE):
+        source = [model.mlps[i].output for i in range(n_layers)].save()
+
+    expected = []
+    for layer_idx in range(n_layers):
+        with model.trace(DESTINATION):
+            model.mlps[layer_idx].output = source[layer_idx]
+            metric = patched_metric(model, incorrect_id, diffs).save()
+        expected.append(metric.float())
+
+    expected = t.stack(expected)
+    for results in run_twice(patch_components, model, make_request("mlp", incorrect_id)):
+        t.testing.assert_close(results, expected, rtol=1e-4, atol=1e-5)
+
+
+@pytest.mark.parametrize("incorrect_id", [INCORRECT_ID, None])
+def test_patch_heads(model, incorrect_id):
+    n_layers, n_heads = model.num_layers, model.num_heads
+    diffs = clean_diffs(model, incorrect_id)
+
+    with model.trace(SOURCE):
+        source = [model.attentions[i].o_proj.input for i in range(n_layers)].save()
+
+    expected = []
+    for layer_idx in range(n_layers):
+        source_LHDh = source[layer_idx][0].unflatten(-1, (n_heads, -1))
+
+        for head_idx in range(n_heads):
+            with model.trace(DESTINATION):
+                o_proj = model.attentions[layer_idx].o_proj
+                hidden_BLHDh = o_proj.input.unflatten(-1, (n_heads, -1))
+                hidden_BLHDh[0, :, head_idx] = source_LHDh[:, head_idx]
+                o_proj.input = hidden_BLHDh.flatten(-2)
+                metric = patched_metric(model, incorrect_id, diffs).save()
+            expected.append(metric.float())
+
+    expected = t.stack(expected)
+    for results in run_twice(patch_heads, model, make_request("heads", incorrect_id)):
+        t.testing.assert_close(results, expected, rtol=1e-4, atol=1e-5)
+
+
+@pytest.mark.parametrize("incorrect_id", [INCORRECT_ID, None])
+def test_patch_positions(model, incorrect_id):
+    n_layers = model.num_layers
+    diffs = clean_diffs(model, incorrect_id)
+    cells = [
+        (layer_idx, destination_idx, source_idx)
+        for layer_idx in range(n_layers)
+        for destination_idx, source_idx in [(1, 1), (3, 9), (9, 3), (12, 12)]
+    ]
+
+    with model.trace(SOURCE):
+        source = [model.mlps[i].output for i in range(n_layers)].save()
+
+    expected = []
+    for layer_idx, destination_idx, source_idx in cells:
+        with model.trace(DESTINATION):
+            hidden_BLD = model.mlps[layer_idx].output
+            hidden_BLD[0, destination_idx] = source[layer_idx][0, source_idx]
+            model.mlps[layer_idx].output = hidden_BLD
+            metric = patched_metric(model, incorrect_id, diffs).save()
+        expected.append(metric.float())
+
+    expected = t.stack(expected)
+    for results in run_twice(patch_positions, model, make_request("mlp", incorrect_id), cells):
+        t.testing.assert_close(results, expected, rtol=1e-4, atol=1e-5)
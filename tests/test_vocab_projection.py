@@ -0,0 +1,37 @@
+import pytest
+
+t = pytest.importorskip("torch")
+
+from workbench._api.vocab_projection import rank_of  # noqa: E402
+
+
+def sort_ranks(logits, target_ids):
+    """Ranks as the full descending sort gives them (ties in sort order)."""
+    order = logits.argsort(dim=-1, descending=True)
+    ranks = order.argsort(dim=-1) + 1
+    return ranks.gather(-1, target_ids)
+
+
+def test_rank_of_matches_sort_without_ties():
+    generator = t.Generator().manual_seed(0)
+    logits = t.randn(3, 4, 1000, generator=generator)
+    target_ids = t.randint(0, 1000, (3, 4, 5), generator=generator)
+
+    assert t.equal(rank_of(logits, target_ids), sort_ranks(logits, target_ids))
+
+
+def test_rank_of_ties_share_the_lowest_rank():
+    logits = t.tensor([[3.0, 5.0, 5.0, 1.0, 5.0, 3.0]])
+    target_ids = t.tensor([[1, 2, 4, 0, 5, 3]])
+
+    # Three-way tie for first, two-way tie behind it.
+    assert rank_of(logits, target_ids).tolist() == [[1, 1, 1, 4, 4, 6]]
+
+
+def test_rank_of_bf16_ties():
+    # Distinct in float32, equal once rounded to bf16.
+    logits = t.tensor([[1.0, 1.001, 1.002, 0.5]]).to(t.bfloat16)
+    assert logits[0, 0] == logits[0, 1] == logits[0, 2]
+
+    ranks = rank_of(logits, t.tensor([[0, 1, 2, 3]]))
+    assert ranks.tolist() == [[1, 1, 1, 4]]
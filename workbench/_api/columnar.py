@@ -0,0 +1,124 @@
+"""Opt-in columnar encoding for lens responses.
+
+The default lens responses nest a Pydantic object per cell, so an
+80-layer × 1000-token grid serializes 80k ``{"x", "y", "label"}`` objects.
+A client that sends one of the media types below in ``Accept`` gets the
+same data as dense arrays instead:
+
+    ``application/vnd.workbench.columnar+json``
+        One JSON object. Arrays are flat lists in row-major order, with
+        their shape given under ``shapes``.
+
+    ``application/vnd.workbench.columnar``
+        Binary: a little-endian ``uint32`` header length, then a UTF-8 JSON
+        header, then the raw little-endian array bytes. Each header entry
+        under ``arrays`` gives ``dtype``, ``shape``, ``offset`` (from the
+        start of the array bytes, 8-byte aligned) and ``nbytes``, so a
+        browser can wrap each one in a typed array without copying.
+
+Both carry a ``labels`` dictionary mapping every token id referenced by an
+id array to its decoded string.
+"""
+
+import json
+
+import numpy as np
+import torch
+from fastapi import Request, Response
+
+COLUMNAR_JSON = "application/vnd.workbench.columnar+json"
+COLUMNAR_BINARY = "application/vnd.workbench.columnar"
+
+_ALIGN = 8
+
+
+def negotiate(request: Request) -> str | None:
+    """The columnar media type the client asked for, if any.
+
+    Only exact media-type matches count, so ``*/*`` and
+    ``application/json`` keep the default nested response.
+    """
+    accepted = [
+        part.split(";")[0].strip().lower()
+        for part in request.headers.get("accept", "").split(",")
+    ]
+
+    for media_type in (COLUMNAR_BINARY, COLUMNAR_JSON):
+        if media_type in accepted:
+            return media_type
+
+    return None
+
+
+def encode(
+    arrays: dict[str, torch.Tensor | np.ndarray],
+    media_type: str,
+    **fields,
+) -> Response:
+    """Encode ``arrays`` plus JSON-ready ``fields`` as ``media_type``.
+
+    Args:
+        arrays: Named tensors or ndarrays. Tensors move to the CPU, and
+            float64 / int64 narrow to float32 / int32.
+        media_type: ``COLUMNAR_JSON`` or ``COLUMNAR_BINARY``.
+        **fields: Other keys of the payload (e.g. ``labels``).
+    """
+    arrays = {name: _as_array(value) for name, value in arrays.items()}
+    headers = {"Vary": "Accept"}
+
+    if media_type == COLUMNAR_JSON:
+        payload = {
+            **fields,
+            "shapes": {name: list(array.shape) for name, array in arrays.items()},
+            **{name: _json_list(array) for name, array in arrays.items()},
+        }
+        body = json.dumps(payload, separators=(",", ":")).encode()
+        return Response(content=body, media_type=media_type, headers=headers)
+
+    layout, chunks, offset = {}, [], 0
+    for name, array in arrays.items():
+        data = array.astype(array.dtype.newbyteorder("<"), copy=False).tobytes()
+        layout[name] = {
+            "dtype": array.dtype.name,
+            "shape": list(array.shape),
+            "offset": offset,
+            "nbytes": len(data),
+        }
+        padding = -len(data) % _ALIGN
+        chunks.append(data + b"\0" * padding)
+        offset += len(data) + padding
+
+    header = json.dumps({**fields, "arrays": layout}, separators=(",", ":")).encode()
+    # Pad the header too, so array offsets stay aligned in the whole body.
+    header += b" " * (-(4 + len(header)) % _ALIGN)
+    body = len(header).to_bytes(4, "little") + header + b"".join(chunks)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+def label_table(handle, *id_arrays) -> dict[str, str]:
+    """``{str(id): label}`` for every distinct id in ``id_arrays``."""
+    ids = np.unique(np.concatenate([_as_array(ids).ravel() for ids in id_arrays]))
+    return dict(zip(map(str, ids.tolist()), handle.decode_ids(ids).tolist()))
+
+
+def _json_list(array: np.ndarray) -> list:
+    """Flat list; floats rounded to 6 decimals so the float64 repr of a
+    float32 value doesn't inflate the payload."""
+    if np.issubdtype(array.dtype, np.floating):
+        array = array.astype(np.float64).round(6)
+    return array.ravel().tolist()
+
+
+def _as_array(value) -> np.ndarray:
+    if isinstance(value, torch.Tensor):
+        value = value.detach().cpu()
+        if value.dtype == torch.bfloat16:
+            value = value.float()
+        value = value.numpy()
+
+    value = np.asarray(value)
+    if value.dtype == np.float64:
+        return value.astype(np.float32)
+    if value.dtype == np.int64:
+        return value.astype(np.int32)
+    return value
@@ -35,6 +35,14 @@ class ModelHeat(str, Enum):
         return a if a.rank <= b.rank else b
 
 
+class LabelMode(str, Enum):
+    """How token labels are sent: decoded ``text``, or token ``ids`` (as
+    decimal strings) that the client resolves via ``GET /models/vocab/{model}``."""
+
+    TEXT = "text"
+    IDS = "ids"
+
+
 class Message(BaseModel):
     role: Literal["user", "assistant"]
     content: str
@@ -0,0 +1,147 @@
+"""In-process job registry for long local runs (patch sweeps).
+
+NDIF jobs already report status and can be abandoned server-side; local runs
+execute in a worker thread of this process. A ``LocalJob`` gives such a run
+progress (cells done / total), the partial results so far and a cancel flag
+that the run checks between forward passes.
+"""
+
+import threading
+import uuid
+from collections import OrderedDict
+
+import torch
+
+
+class JobCancelled(Exception):
+    """Raised inside a run when its job has been cancelled."""
+
+
+class LocalJob:
+    """Progress, partial results and cancellation for one local run.
+
+    Written by the worker thread running the job and read by request
+    handlers, so every mutable field is guarded by ``_lock``.
+
+    Attributes:
+        id: Job ID (client-supplied or a random hex string).
+        owner: Email of the user who started the run; only they can read
+            or cancel it.
+        total: Cells the run will produce; set by the run once known.
+        done: Cells produced so far.
+        partial: Values of the produced cells, in output order.
+        status: ``RUNNING``, ``COMPLETED``, ``CANCELLED`` or ``ERROR``.
+    """
+
+    def __init__(self, job_id: str, owner: str | None = None):
+        self.id = job_id
+        self.owner = owner
+        self.total = 0
+        self.done = 0
+        self.partial: list[float] = []
+        self.status = "RUNNING"
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def cancel(self) -> None:
+        """Ask the run to stop at its next ``check_cancelled``."""
+        self._cancel.set()
+
+    def check_cancelled(self) -> None:
+        """Raise ``JobCancelled`` if the job has been cancelled."""
+        if self._cancel.is_set():
+            raise JobCancelled(self.id)
+
+    def advance(self, values) -> None:
+        """Record newly produced cells, then stop here if cancelled.
+
+        Args:
+            values: The cells' values — a tensor (any device) or a list.
+        """
+        if isinstance(values, torch.Tensor):
+            values = values.detach().float().cpu().flatten().tolist()
+
+        with self._lock:
+            self.partial.extend(values)
+            self.done += len(values)
+
+        self.check_cancelled()
+
+    def set_status(self, status: str) -> None:
+        with self._lock:
+            self.status = status
+
+    def snapshot(self) -> dict:
+        """JSON-ready status, progress and partial results."""
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "done": self.done,
+                "total": self.total,
+                "partial": list(self.partial),
+            }
+
+
+class JobRegistry:
+    """Running local jobs plus the most recently finished ones.
+
+    Class attributes:
+        max_finished: Finished jobs kept for status polls after they end.
+    """
+
+    max_finished: int = 64
+
+    def __init__(self):
+        self._running: dict[str, LocalJob] = {}
+        self._finished: OrderedDict[str, LocalJob] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, job_id: str | None = None, owner: str | None = None) -> LocalJob:
+        """Register a new running job for ``owner``.
+
+        Raises:
+            ValueError: ``job_id`` belongs to a job that is still running, or
+                to a finished job of another user.
+        """
+        job_id = job_id or uuid.uuid4().hex
+
+        with self._lock:
+            if job_id in self._running:
+                raise ValueError(f"Job {job_id} is already running")
+
+            finished = self._finished.get(job_id)
+            if finished is not None and finished.owner != owner:
+                raise ValueError(f"Job {job_id} belongs to another user")
+
+            self._finished.pop(job_id, None)
+            job = LocalJob(job_id, owner)
+            self._running[job_id] = job
+            return job
+
+    def get(self, job_id: str, owner: str | None) -> LocalJob | None:
+        """The job ``job_id`` if ``owner`` started it, else ``None``.
+
+        Someone else's job looks the same as an unknown one, so job IDs
+        can't be probed.
+        """
+        with self._lock:
+            job = self._running.get(job_id) or self._finished.get(job_id)
+
+        if job is None or job.owner is None or job.owner != owner:
+            return None
+        return job
+
+    def finish(self, job: LocalJob, status: str) -> None:
+        """Mark ``job`` finished with ``status`` and retire it."""
+        job.set_status(status)
+
+        with self._lock:
+            self._running.pop(job.id, None)
+            self._finished[job.id] = job
+            while len(self._finished) > self.max_finished:
+                self._finished.popitem(last=False)
@@ -1,5 +1,8 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+import asyncio
 import logging
 import os
 import anyio
@@ -31,8 +34,17 @@ ALLOWED_ORIGIN_REGEX = (
 )
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load pinned models in the background so the server starts answering
+    # (models list, /ready, already-loaded models) while they come up.
+    preload = asyncio.create_task(app.state.m.preload_pinned())
+    yield
+    preload.cancel()
+
+
 def fastapi_app():
-    app = FastAPI()
+    app = FastAPI(lifespan=lifespan)
 
     # In environments where the fronting ingress handles CORS (e.g. the
     # ripley preview chart sets enable-cors annotations and needs OPTIONS
@@ -65,6 +77,11 @@ def fastapi_app():
 
     app.state.m = AppState()
 
+    @app.get("/ready")
+    async def ready():
+        readiness = app.state.m.get_readiness()
+        return JSONResponse(readiness, status_code=200 if readiness["ready"] else 503)
+
     return app
 
 
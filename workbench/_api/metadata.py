@@ -137,9 +137,27 @@ class ModelMetadata(BaseModel):
     params: str
     gated: bool
 
+    @property
+    def num_params(self) -> int:
+        """Approximate raw parameter count parsed back out of ``params``.
+
+        Inverse of ``_format_params`` (so only as precise as its rounding).
+        Returns 0 when the count is ``"unknown"``.
+        """
+        scale = _PARAM_SCALES.get(self.params[-1:])
+        if scale is None:
+            return 0
+        try:
+            return int(float(self.params[:-1]) * scale)
+        except ValueError:
+            return 0
+
 
 # ----- raw fetch + helpers -----------------------------------------------
 
+# Suffixes emitted by ``_format_params``.
+_PARAM_SCALES = {"B": 10**9, "M": 10**6, "K": 10**3}
+
 
 def _format_params(num_params: int) -> str:
     """Format a raw parameter count as a compact human-readable string.
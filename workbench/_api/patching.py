@@ -0,0 +1,314 @@
+"""Patching metrics and interventions that run inside traces.
+
+Like ``vocab_projection``, everything here executes inside ``model.session``
+— locally or on NDIF — so the module depends on torch only and is
+registered with ``ndif.register`` (see ``routes/__init__.py``) to be
+shipped to the server by value. Arguments are plain ints and tensors;
+request models never enter a trace.
+
+Public API:
+
+    ``logit_difference`` / ``get_prob`` / ``compute_ioi_metric``
+        The patch-grid metrics for a single, unbatched pass.
+
+    ``batched_metric``
+        The patched metric for every row of a batched destination pass.
+
+    ``stack_layers``
+        Per-layer activations stacked into one ``[n_layers, ...]`` tensor.
+
+    ``skip_clean_layers``
+        Resume a batched pass at a layer, replaying clean outputs below it.
+
+    ``source_activations`` / ``clean_baselines``
+        A sweep's stacked source activations and clean destination pass,
+        taken from (and added to) a cached baseline bundle when given one.
+
+    ``attribution_effect``
+        First-order estimate of a layer's patch effect, per patched slice.
+
+    ``baseline_diffs`` / ``detached``
+        Clean logit differences from cached logits; detach a cached bundle.
+
+Dimension key as in ``routes/patch.py`` (L is sequence length).
+"""
+
+import os
+
+import torch as t
+
+EPS = 1e-10
+
+# Destination rows per forward pass in the batched patching sweeps: each row
+# carries one patch, so a sweep over N patches takes ceil(N / PATCH_MAX_BATCH)
+# passes. Lower it to bound activation memory. Override via PATCH_MAX_BATCH.
+PATCH_MAX_BATCH = int(os.environ.get("PATCH_MAX_BATCH", "16"))
+
+
+def logit_difference(model, correct_id: int, incorrect_id: int):
+    logits = model.logits
+    return logits[0, -1, correct_id] - logits[0, -1, incorrect_id]
+
+
+def compute_ioi_metric(source_diff, destination_diff, patched_diff):
+    return (patched_diff - destination_diff) / (
+        (source_diff - destination_diff) + EPS
+    )
+
+
+def get_prob(model, correct_id: int):
+    logits = model.logits
+    probs = t.softmax(logits, dim=-1)
+    return probs[0, -1, correct_id]
+
+
+def batched_metric(
+    model,
+    correct_id: int,
+    incorrect_id: int | None = None,
+    source_diff=None,
+    destination_diff=None,
+):
+    """Patch metric for every row of a batched destination trace.
+
+    Row-wise equivalent of ``compute_ioi_metric(..., logit_difference(...))``
+    when ``incorrect_id`` is set, and of ``get_prob`` otherwise.
+
+    Returns:
+        ``[B]`` tensor, one value per batch row.
+    """
+    logits_BV = model.logits[:, -1]
+
+    if incorrect_id is not None:
+        patched_diff_B = logits_BV[:, correct_id] - logits_BV[:, incorrect_id]
+        return compute_ioi_metric(source_diff, destination_diff, patched_diff_B)
+
+    return t.softmax(logits_BV, dim=-1)[:, correct_id]
+
+
+def stack_layers(activations: list[t.Tensor]) -> t.Tensor:
+    """Stack per-layer ``[1, ...]`` activations into one ``[n_layers, ...]`` tensor.
+
+    Keeps a sweep's source activations as a single tensor, indexed at patch
+    time, rather than a slice per (layer, position) or (layer, head). Layers
+    can sit on different devices, so everything moves to the last layer's.
+    """
+    device = activations[-1].device
+    return t.stack([activation[0].to(device) for activation in activations])
+
+
+def skip_clean_layers(
+    model,
+    clean_outputs: list,
+    n_skipped: int,
+    batch_size: int,
+):
+    """Resume a batched destination pass at layer ``n_skipped``.
+
+    Every patch in the pass sits at or above ``n_skipped``, so the blocks
+    below it would recompute the clean destination run. They are skipped
+    instead, each returning its output from the clean pass repeated over
+    the batch. Call inside the trace, before touching any layer.
+
+    Args:
+        model: Loaded wrapper.
+        clean_outputs: Per-layer block outputs of the clean destination pass.
+        n_skipped: Number of leading blocks to skip.
+        batch_size: Rows in the current pass.
+    """
+    for layer_idx in range(n_skipped):
+        clean = clean_outputs[layer_idx]
+
+        if isinstance(clean, tuple):
+            replacement = (clean[0].repeat(batch_size, 1, 1), *clean[1:])
+        else:
+            replacement = clean.repeat(batch_size, 1, 1)
+
+        model.layers[layer_idx].skip(replacement)
+
+
+def source_activations(
+    components: list,
+    *,
+    is_tuple: bool = False,
+    n_heads: int | None = None,
+) -> t.Tensor:
+    """Stack one activation per layer from the current trace.
+
+    Args:
+        components: One submodule per layer.
+        is_tuple: Outputs are tuples (decoder blocks); take the hidden state.
+        n_heads: Take each component's input split into this many heads
+            (``o_proj`` inputs) instead of its output.
+
+    Returns:
+        ``[n_layers, L, D]``, or ``[n_layers, L, H, Dh]`` with ``n_heads``.
+    """
+    if n_heads is not None:
+        return stack_layers(
+            [component.input.unflatten(-1, (n_heads, -1)) for component in components]
+        )
+
+    hiddens = []
+    for component in components:
+        hidden_BLD = component.output
+        if is_tuple:
+            hidden_BLD = hidden_BLD[0]
+        hiddens.append(hidden_BLD)
+
+    return stack_layers(hiddens)
+
+
+def clean_baselines(
+    model,
+    components: list,
+    source: str,
+    destination: str,
+    correct_id: int,
+    incorrect_id: int | None,
+    *,
+    source_key: str,
+    is_tuple: bool = False,
+    n_heads: int | None = None,
+    baseline: dict | None = None,
+):
+    """Everything a patch sweep needs from the clean runs, in one place.
+
+    Call inside ``model.session``, outside any trace. What ``baseline``
+    already holds is reused; whatever is missing is traced (the source
+    pass, the clean destination pass, or both) and added to it.
+
+    Args:
+        model: Loaded wrapper.
+        components: Per-layer submodules the sweep patches.
+        source: Source prompt.
+        destination: Destination prompt.
+        correct_id: Metric target token.
+        incorrect_id: Contrast token, or ``None`` for the probability metric.
+        source_key: ``baseline`` key of the source activations (they differ
+            per submodule).
+        is_tuple: See ``source_activations``.
+        n_heads: See ``source_activations``.
+        baseline: Cached bundle with ``source_key``, ``source_logits``,
+            ``clean_outputs`` and ``destination_logits``; ``None`` on NDIF.
+
+    Returns:
+        ``(source_stack, clean_outputs, source_diff, destination_diff)``.
+    """
+    cached = dict(baseline) if baseline is not None else {}
+
+    # Called from a session body, these traces run as root traces of this
+    # frame: only ``.save()``d values come back out of them.
+    if source_key in cached:
+        source_stack = cached[source_key]
+        source_logits = cached["source_logits"]
+    else:
+        with model.trace(source):
+            source_stack = source_activations(
+                components, is_tuple=is_tuple, n_heads=n_heads
+            ).save()
+            source_logits = model.logits[0, -1].clone().save()
+
+    if "clean_outputs" in cached:
+        clean_outputs = cached["clean_outputs"]
+        destination_logits = cached["destination_logits"]
+    else:
+        with model.trace(destination):
+            clean_outputs = [model.layers[i].output for i in range(model.num_layers)].save()
+            destination_logits = model.logits[0, -1].clone().save()
+
+    source_diff, destination_diff = baseline_diffs(
+        source_logits, destination_logits, correct_id, incorrect_id
+    )
+
+    if baseline is not None:
+        baseline.update(
+            detached(
+                {
+                    source_key: source_stack,
+                    "source_logits": source_logits,
+                    "clean_outputs": clean_outputs,
+                    "destination_logits": destination_logits,
+                }
+            )
+        )
+
+    return source_stack, clean_outputs, source_diff, destination_diff
+
+
+def attribution_effect(
+    source_LD: t.Tensor,
+    destination_LD: t.Tensor,
+    grad_LD: t.Tensor,
+    *,
+    source_idxs: t.Tensor | None = None,
+    destination_idxs: t.Tensor | None = None,
+    n_heads: int | None = None,
+) -> t.Tensor:
+    """First-order change in the metric from patching one layer's activation.
+
+    ``(a_source - a_destination) · grad``, summed over each patched slice.
+
+    Args:
+        source_LD: Source activation, ``[L_src, D]``.
+        destination_LD: Destination activation, ``[L, D]``.
+        grad_LD: Metric gradient at the destination activation, ``[L, D]``.
+        source_idxs: Per-column source positions when patching positions.
+        destination_idxs: Per-column destination positions, aligned with
+            ``source_idxs``.
+        n_heads: Split ``D`` into this many heads and patch each head over
+            every position.
+
+    Returns:
+        float32 on the CPU: ``[C]`` for positions, ``[n_heads]`` for heads,
+        otherwise ``[1]`` (the whole activation patched at once).
+    """
+    source_LD = source_LD.to(grad_LD.device).float()
+    destination_LD = destination_LD.float()
+    grad_LD = grad_LD.float()
+
+    if destination_idxs is not None:
+        effect = (
+            (source_LD[source_idxs] - destination_LD[destination_idxs])
+            * grad_LD[destination_idxs]
+        ).sum(dim=-1)
+    elif n_heads is not None:
+        effect = (
+            ((source_LD - destination_LD) * grad_LD)
+            .unflatten(-1, (n_heads, -1))
+            .sum(dim=(0, 2))
+        )
+    else:
+        effect = ((source_LD - destination_LD) * grad_LD).sum().unsqueeze(0)
+
+    return effect.cpu()
+
+
+def baseline_diffs(
+    source_logits_V: t.Tensor,
+    destination_logits_V: t.Tensor,
+    correct_id: int,
+    incorrect_id: int | None,
+):
+    """Clean ``(source_diff, destination_diff)`` from last-position logits.
+
+    Both are ``None`` when there is no ``incorrect_id`` (probability metric).
+    """
+    if incorrect_id is None:
+        return None, None
+
+    return (
+        source_logits_V[correct_id] - source_logits_V[incorrect_id],
+        destination_logits_V[correct_id] - destination_logits_V[incorrect_id],
+    )
+
+
+def detached(value):
+    """``value`` with every tensor detached, through dicts, tuples and lists."""
+    if isinstance(value, t.Tensor):
+        return value.detach()
+    if isinstance(value, dict):
+        return {key: detached(v) for key, v in value.items()}
+    if isinstance(value, (tuple, list)):
+        return type(value)(detached(v) for v in value)
+    return value
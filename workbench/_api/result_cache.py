@@ -0,0 +1,284 @@
+"""Content-addressed cache of finished lens results.
+
+Identical lens requests (demo prompts, shared links, page reloads) would
+otherwise rerun a trace or submit a fresh NDIF job. Results are stored under
+a hash of ``(model, route, normalized params)`` as JSON: in memory up to a
+byte budget, LRU-evicted, with evicted entries spilled to a directory that
+has its own budget. A disk hit is promoted back into memory.
+
+Values must be JSON-serializable; routes store formatted results (or, for
+the lens grid, its per-statistic lists).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+# Part of every key. Spilled entries outlive the process, so bump this
+# whenever a cached payload changes shape (a formatter, the ``lens/grid``
+# dict, nnsightful's data types): entries written by older code then miss
+# instead of being served as-is.
+RESULT_FORMAT_VERSION = 1
+
+
+class ResultCache:
+    """Two-tier (memory, then disk) LRU of JSON results keyed by content hash.
+
+    Attributes:
+        max_bytes: Budget for the in-memory tier (encoded JSON bytes).
+        directory: Spill directory, or ``None`` to keep memory only.
+        max_disk_bytes: Budget for the spill directory.
+        hits: Lookups served from either tier.
+        disk_hits: The subset of ``hits`` served from disk.
+        misses: Lookups found in neither tier.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        directory: str | None = None,
+        max_disk_bytes: int = 0,
+    ):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._bytes = 0
+        # Spilled entries and their sizes, oldest first.
+        self._disk: OrderedDict[str, int] = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+
+        if directory:
+            self._scan_directory()
+
+    @staticmethod
+    def key(model: str, route: str, params: dict[str, Any]) -> str:
+        """Content hash of a request; ``params`` are normalized by sorting keys.
+
+        Includes ``RESULT_FORMAT_VERSION``, so a format change invalidates
+        every earlier entry, in memory and on disk.
+        """
+        blob = json.dumps(
+            {
+                "version": RESULT_FORMAT_VERSION,
+                "model": model,
+                "route": route,
+                "params": params,
+            },
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(blob.encode()).hexdigest()
+
+    def get(self, key: str) -> Any | None:
+        """Return the decoded value for ``key``, or ``None`` on a miss.
+
+        Reads the spill file on a memory miss, so call off the event loop.
+        """
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return json.loads(body)
+            on_disk = key in self._disk
+
+        body = self._read(key) if on_disk else None
+
+        with self._lock:
+            if body is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+
+        self._insert(key, body)
+        return json.loads(body)
+
+    def put(self, key: str, value: Any) -> None:
+        """Store ``value`` for ``key``, spilling evicted entries to disk."""
+        self._insert(key, json.dumps(value, separators=(",", ":")).encode())
+
+    def stats(self) -> dict:
+        """Entry counts and bytes for both tiers, plus hit/miss counters."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "budget_bytes": self.max_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+                "disk_budget_bytes": self.max_disk_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
+
+    def _insert(self, key: str, body: bytes) -> None:
+        evicted = []
+
+        with self._lock:
+            self._bytes -= len(self._entries.pop(key, b""))
+            if len(body) <= self.max_bytes:
+                self._entries[key] = body
+                self._bytes += len(body)
+            else:
+                evicted.append((key, body))
+            while self._bytes > self.max_bytes:
+                oldest, oldest_body = self._entries.popitem(last=False)
+                self._bytes -= len(oldest_body)
+                evicted.append((oldest, oldest_body))
+
+        for evicted_key, evicted_body in evicted:
+            self._spill(evicted_key, evicted_body)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _spill(self, key: str, body: bytes) -> None:
+        """Write an evicted entry to disk, then trim the directory to budget."""
+        if not self.directory or len(body) > self.max_disk_bytes:
+            return
+
+        try:
+            tmp_path = f"{self._path(key)}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(body)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            logger.warning(f"Failed to spill cached result {key}: {e}")
+            return
+
+        with self._lock:
+            self._disk_bytes -= self._disk.pop(key, 0)
+            self._disk[key] = len(body)
+            self._disk_bytes += len(body)
+            dropped = []
+            while self._disk_bytes > self.max_disk_bytes:
+                oldest, size = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+                dropped.append(oldest)
+
+        for oldest in dropped:
+            try:
+                os.remove(self._path(oldest))
+            except OSError:
+                pass
+
+    def _read(self, key: str) -> bytes | None:
+        try:
+            with open(self._path(key), "rb") as f:
+                body = f.read()
+        except OSError:
+            with self._lock:
+                self._disk_bytes -= self._disk.pop(key, 0)
+            return None
+
+        with self._lock:
+            if key in self._disk:
+                self._disk.move_to_end(key)
+        return body
+
+    def _scan_directory(self) -> None:
+        """Index spill files left by a previous process, oldest first."""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            files = [
+                entry for entry in os.scandir(self.directory)
+                if entry.is_file() and entry.name.endswith(".json")
+            ]
+        except OSError as e:
+            logger.warning(f"Result cache directory unavailable, memory only: {e}")
+            self.directory = None
+            return
+
+        for entry in sorted(files, key=lambda entry: entry.stat().st_mtime):
+            size = entry.stat().st_size
+            self._disk[entry.name.removesuffix(".json")] = size
+            self._disk_bytes += size
+
+
+class PendingResults:
+    """What each unfinished NDIF job's result will be cached as.
+
+    ``/results/{job_id}`` bodies are client-supplied and not tied to the
+    job, so a key built from them would let any user store one job's output
+    under another request's key. ``/start`` records the key (plus whatever
+    else the write needs) against the job instead, and ``/results`` caches
+    only what it finds here. Records nobody collects are dropped oldest
+    first past ``max_entries``.
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._records: OrderedDict[str, tuple[str, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, job_id: str, owner: str, record: Any) -> None:
+        """Remember ``record`` for ``job_id``, submitted by ``owner``."""
+        with self._lock:
+            self._records[job_id] = (owner, record)
+            self._records.move_to_end(job_id)
+            while len(self._records) > self.max_entries:
+                self._records.popitem(last=False)
+
+    def pop(self, job_id: str, owner: str) -> Any | None:
+        """Take ``job_id``'s record; ``None`` if there is none or it belongs
+        to someone other than ``owner``."""
+        with self._lock:
+            entry = self._records.get(job_id)
+            if entry is None or entry[0] != owner:
+                return None
+            del self._records[job_id]
+            return entry[1]
+
+
+def slice_top_k(data: dict, top_k: int) -> dict:
+    """A ``LogitLensData``-shaped result narrowed to its first ``top_k``.
+
+    ``topk`` (``[L][T][k]`` labels) is truncated per cell, and each
+    position's ``tracked`` trajectories are cut back to the union of its
+    remaining top-k labels across layers — what a run at ``top_k`` returns.
+    """
+    topk = [[cell[:top_k] for cell in row] for row in data["topk"]]
+
+    tracked = data.get("tracked")
+    if tracked is not None:
+        kept = [set() for _ in tracked]
+        for row in topk:
+            for pos, cell in enumerate(row):
+                kept[pos].update(cell)
+        tracked = [
+            {label: trajectory for label, trajectory in by_label.items() if label in keep}
+            for by_label, keep in zip(tracked, kept)
+        ]
+
+    return {**data, "topk": topk, "tracked": tracked}
+
+
+def get_top_k(cache: ResultCache, key: str, top_k: int) -> dict | None:
+    """A cached top-k result for ``key``, sliced from any entry with k >= ``top_k``.
+
+    The key must not include ``top_k``; entries store the k they ran with.
+    """
+    cached = cache.get(key)
+    if cached is None or cached["top_k"] < top_k:
+        return None
+    if cached["top_k"] == top_k:
+        return cached["data"]
+    return slice_top_k(cached["data"], top_k)
+
+
+def put_top_k(cache: ResultCache, key: str, top_k: int, data: dict) -> None:
+    """Store a result computed at ``top_k`` for ``get_top_k``."""
+    cache.put(key, {"top_k": top_k, "data": data})
@@ -8,7 +8,11 @@ from .causal_mediation import router as causal_mediation
 
 from nnsight import ndif
 import nnsightful
+from .. import patching, vocab_projection
 ndif.register(nnsightful)
+# Helpers called inside traces must be shipped to NDIF by value as well.
+ndif.register(vocab_projection)
+ndif.register(patching)
 
 __all__ = [
     "lens",
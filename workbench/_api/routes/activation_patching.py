@@ -33,7 +33,7 @@ async def start_activation_patching(
     state: AppState = Depends(get_state),
     user_email: str = Depends(require_user_email),
 ):
-    model = state[request.model_name]
+    model = await state.aget_model(request.model_name)
     backend = state.make_backend(model=model)
 
     output = activation_patching._run(
@@ -7,8 +7,10 @@ from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, Field
 
 from ..auth import require_user_email
-from ..data_models import NDIFResponse
-from ..state import AppState, get_state
+from ..data_models import LabelMode, NDIFResponse
+from ..patching import PATCH_MAX_BATCH, skip_clean_layers, stack_layers
+from ..state import AppState, ModelHandle, get_state
+from ..vocab_projection import layer_lens_reductions, rank_of, union_ids_per_position
 
 from nnsightful.types import LogitLensData
 
@@ -33,55 +35,83 @@ class CausalMediationResponse(NDIFResponse):
     data: LogitLensData | None = None
 
 
+class CausalMediationSweepRequest(BaseModel):
+    """Every (src_layer, tgt_layer) pair over two layer ranges, for one
+    (src_token_pos, tgt_token_pos) pair. Ranges are half-open; an omitted
+    end means the model's layer count."""
+    model: str
+    src_prompt: str
+    tgt_prompt: str
+    src_token_pos: int = Field(ge=0)
+    tgt_token_pos: int = Field(ge=0)
+    src_layer_start: int = Field(default=0, ge=0)
+    src_layer_end: int | None = Field(default=None, ge=1)
+    tgt_layer_start: int = Field(default=0, ge=0)
+    tgt_layer_end: int | None = Field(default=None, ge=1)
+    # Token whose probability/rank is measured; defaults to the source
+    # pass's own prediction at src_token_pos.
+    target_id: int | None = Field(default=None, ge=0)
+
+
+class CausalMediationSweepData(BaseModel):
+    """``probs`` / ``ranks`` are ``[src_layer][tgt_layer]`` grids of the
+    target token's final-layer probability and rank at ``tgt_token_pos``
+    in the patched target pass."""
+    src_layers: list[int]
+    tgt_layers: list[int]
+    target_id: int
+    target_token: str
+    probs: list[list[float]]
+    ranks: list[list[int]]
+
+
+class CausalMediationSweepResponse(NDIFResponse):
+    data: CausalMediationSweepData | None = None
+
+
 def _format_lens(
-    logits: torch.Tensor,
-    tokenizer,
+    lens: dict[str, torch.Tensor],
+    handle: ModelHandle,
     model_name: str,
     input_tokens: list[str],
     n_layers: int,
     *,
-    top_k: int = 5,
     include_entropy: bool = True,
+    labels: LabelMode = LabelMode.TEXT,
 ) -> dict[str, Any]:
     """Inlined mirror of the local `format()` inside
-    `nnsightful.tools.logit_lens._run`. Turns a [L, T, V] logits tensor into
-    the dict shape consumed by `LogitLensData(**...)`.
+    `nnsightful.tools.logit_lens._run`. Turns the reductions saved by
+    `_run_causal_mediation` into the dict shape consumed by
+    `LogitLensData(**...)`.
 
     Why: `LogitLensTool` doesn't override `_format`, so calling
     `logit_lens_tool._format(...)` falls through to the abstract `Tool._format`
     in `nnsightful/tools/_base.py` whose body is `...` — i.e. returns `None`.
+
+    With ``labels=ids`` every token label (top-k entries and trajectory
+    keys) is its id as a decimal string, and nothing is decoded.
     """
+    as_ids = labels == LabelMode.IDS
     layers = list(range(n_layers))
     positions = list(range(len(input_tokens)))
 
-    if include_entropy:
-        # log_softmax once, then exp() reuses it for probs — softmax(x) ==
-        # log_softmax(x).exp() — so we avoid a second full-tensor softmax pass.
-        log_p = torch.nn.functional.log_softmax(logits, dim=-1)
-        probs = log_p.exp()
-        entropy = torch.round(-(probs * log_p).sum(dim=-1), decimals=3).tolist()
-    else:
-        probs = torch.nn.functional.softmax(logits, dim=-1)
-        entropy = None
-
-    _, top_indices = torch.topk(probs, k=top_k, dim=-1)
-
-    topks = [
-        [tokenizer.batch_decode(torch.tensor(pos).unsqueeze(dim=1)) for pos in layer]
-        for layer in top_indices.tolist()
-    ]
+    entropy = (
+        torch.round(lens["entropy"], decimals=3).tolist() if include_entropy else None
+    )
 
-    unique_indices = [
-        torch.unique(top_indices[:, pi, :].flatten(), sorted=False).tolist()
-        for pi in range(top_indices.shape[1])
-    ]
-    probs = probs.permute(1, 2, 0)
+    # [L, T, k] labels in a single vocab-table gather.
+    topks = handle.label_ids(lens["top_ids"], as_ids).tolist()
+
+    # Trajectories over every layer for each position's tracked ids (the
+    # union of its top-k across layers). Padding repeats an id, so it only
+    # rewrites a dict key with the same values.
+    tracked_labels = handle.label_ids(lens["tracked_ids"], as_ids).tolist()
+    tracked_probs = torch.round(
+        lens["tracked_probs"].permute(1, 2, 0), decimals=3
+    ).tolist()
     trajectories = [
-        {
-            tokenizer.decode(token): torch.round(probs[pos_idx][token], decimals=3).tolist()
-            for token in pos
-        }
-        for pos_idx, pos in enumerate(unique_indices)
+        dict(zip(labels, probs))
+        for labels, probs in zip(tracked_labels, tracked_probs)
     ]
 
     return {
@@ -95,26 +125,25 @@ def _format_lens(
     }
 
 
-def _decode_input_tokens(tokenizer, prompt: str) -> list[str]:
-    """Per-token decoded strings for a prompt (BOS-inclusive, absolute order).
-    Shared by the /start and /results handlers so the two decode loops can't
-    drift apart."""
-    return [str(tokenizer.decode(token)) for token in tokenizer.encode(prompt)]
-
-
-def _validate_indices(req: CausalMediationRequest, model) -> None:
+def _validate_indices(req: CausalMediationRequest, handle: ModelHandle) -> None:
     """Reject out-of-range layer/token indices with a 422 rather than letting an
     IndexError during tracing surface as an opaque 500. `Field(ge=0)` already
     guards negatives; here we bound-check against the model's layer count and
     each prompt's token length."""
-    n_layers = model.num_layers
+    n_layers = handle.num_layers
     if req.src_layer >= n_layers or req.tgt_layer >= n_layers:
         raise HTTPException(
             status_code=422,
             detail=f"Layer index out of range (model has {n_layers} layers).",
         )
-    n_src = len(model.tokenizer.encode(req.src_prompt))
-    n_tgt = len(model.tokenizer.encode(req.tgt_prompt))
+    _validate_positions(req, handle)
+
+
+def _validate_positions(
+    req: CausalMediationRequest | CausalMediationSweepRequest, handle: ModelHandle
+) -> None:
+    n_src = len(handle.encode(req.src_prompt))
+    n_tgt = len(handle.encode(req.tgt_prompt))
     if req.src_token_pos >= n_src:
         raise HTTPException(
             status_code=422,
@@ -127,6 +156,152 @@ def _validate_indices(req: CausalMediationRequest, model) -> None:
         )
 
 
+def _sweep_layers(
+    req: CausalMediationSweepRequest, handle: ModelHandle
+) -> tuple[list[int], list[int]]:
+    """Resolve and bound-check the sweep's layer ranges, positions and
+    target token (422 when invalid)."""
+    n_layers = handle.num_layers
+    src_layers = list(range(req.src_layer_start, req.src_layer_end or n_layers))
+    tgt_layers = list(range(req.tgt_layer_start, req.tgt_layer_end or n_layers))
+
+    if not src_layers or not tgt_layers or max(src_layers + tgt_layers) >= n_layers:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Invalid layer range (model has {n_layers} layers).",
+        )
+    _validate_positions(req, handle)
+
+    vocab_size = len(handle.tokenizer)
+    if req.target_id is not None and req.target_id >= vocab_size:
+        raise HTTPException(
+            status_code=422,
+            detail=f"target_id out of range (vocabulary has {vocab_size} tokens).",
+        )
+
+    return src_layers, tgt_layers
+
+
+def _run_causal_mediation_sweep(
+    model,
+    src_prompt: str,
+    tgt_prompt: str,
+    src_token_pos: int,
+    tgt_token_pos: int,
+    src_layers: list[int],
+    tgt_layers: list[int],
+    target_id: int | None = None,
+    *,
+    max_batch: int = PATCH_MAX_BATCH,
+    remote: bool = False,
+    backend=None,
+) -> dict[str, Any]:
+    """Patch every (src_layer, tgt_layer) pair in one session.
+
+    One source pass captures the residual at ``src_token_pos`` for every
+    layer, and one clean target pass records each block's output. Each
+    patched variant is then a row of a batched target pass: the row writes
+    its source residual into ``tgt_token_pos`` at its target layer. Pairs
+    run target-layer-major in chunks of ``max_batch`` rows, and each pass
+    resumes from its lowest target layer (``skip_clean_layers``). Only the
+    target token's probability and rank at ``tgt_token_pos`` are kept, so
+    the saved result is two ``[S * T]`` vectors, source-layer-major.
+    """
+    n_layers = model.num_layers
+
+    pairs = [(s, t) for t in tgt_layers for s in src_layers]
+    chunks = []
+    for start in range(0, len(pairs), max_batch):
+        chunk = pairs[start:start + max_batch]
+        rows_by_layer = {}
+        for row, (src_layer, tgt_layer) in enumerate(chunk):
+            rows_by_layer.setdefault(tgt_layer, ([], []))
+            rows_by_layer[tgt_layer][0].append(row)
+            rows_by_layer[tgt_layer][1].append(src_layer)
+        chunks.append(
+            (
+                chunk[0][1],
+                len(chunk),
+                {
+                    tgt_layer: (torch.tensor(rows), torch.tensor(srcs))
+                    for tgt_layer, (rows, srcs) in rows_by_layer.items()
+                },
+            )
+        )
+
+    # Position of each (src, tgt) pair, source-major, in the run order above.
+    run_order = {pair: i for i, pair in enumerate(pairs)}
+    src_major = torch.tensor(
+        [run_order[(s, t)] for s in src_layers for t in tgt_layers]
+    )
+
+    with torch.no_grad():
+        with model.session(remote=remote, backend=backend):
+            with model.trace(src_prompt):
+                # [n_layers, D]
+                src_residuals = stack_layers(
+                    [model.layers_output[i][:, src_token_pos] for i in range(n_layers)]
+                )
+                if target_id is None:
+                    target_1 = model.logits[0, src_token_pos].argmax(dim=-1, keepdim=True)
+                else:
+                    target_1 = torch.tensor([target_id])
+
+            with model.trace(tgt_prompt):
+                clean_outputs = [model.layers[i].output for i in range(n_layers)]
+
+            probs, ranks = [], []
+            for first_layer, n_rows, rows_by_layer in chunks:
+                with model.trace([tgt_prompt] * n_rows):
+                    skip_clean_layers(model, clean_outputs, first_layer, n_rows)
+
+                    for tgt_layer, (rows_N, srcs_N) in rows_by_layer.items():
+                        hs = model.layers_output[tgt_layer]
+                        hs[rows_N, tgt_token_pos] = src_residuals[srcs_N].to(hs.device)
+
+                    logits_BV = model.logits[:, tgt_token_pos]
+                    target_B1 = target_1.to(logits_BV.device).repeat(n_rows, 1)
+                    probs.append(
+                        torch.softmax(logits_BV.float(), dim=-1)
+                        .gather(-1, target_B1)
+                        .squeeze(-1)
+                        .cpu()
+                    )
+                    ranks.append(rank_of(logits_BV, target_B1).squeeze(-1).cpu())
+
+            # One saved key ("sweep") so backend() returns a known shape on
+            # the remote path.
+            sweep = {
+                "probs": torch.cat(probs)[src_major],
+                "ranks": torch.cat(ranks)[src_major],
+                "target_id": target_1.cpu(),
+            }.save()
+
+    if remote and backend is not None:
+        return {"job_id": backend.job_id}
+
+    return {"sweep": sweep}
+
+
+def _format_sweep(
+    sweep: dict,
+    handle: ModelHandle,
+    src_layers: list[int],
+    tgt_layers: list[int],
+) -> CausalMediationSweepData:
+    target_id = int(sweep["target_id"].item())
+    shape = (len(src_layers), len(tgt_layers))
+
+    return CausalMediationSweepData(
+        src_layers=src_layers,
+        tgt_layers=tgt_layers,
+        target_id=target_id,
+        target_token=handle.decode_ids([target_id])[0],
+        probs=torch.round(sweep["probs"].reshape(shape), decimals=4).tolist(),
+        ranks=sweep["ranks"].reshape(shape).tolist(),
+    )
+
+
 def _run_causal_mediation(
     model,
     src_prompt: str,
@@ -136,6 +311,8 @@ def _run_causal_mediation(
     tgt_token_pos: int,
     tgt_layer: int,
     *,
+    top_k: int = 5,
+    include_entropy: bool = True,
     remote: bool = False,
     backend=None,
 ) -> dict[str, Any]:
@@ -143,6 +320,10 @@ def _run_causal_mediation(
     into the target prompt at (tgt_layer, tgt_token_pos), then run a logit
     lens over the *patched* forward pass.
 
+    The lens is reduced inside the trace, tile by tile, so neither the
+    server nor the response ever holds the full [L, T, V] logits; see
+    `_format_lens` for the saved keys.
+
     Patching pattern mirrors `nnsightful.tools.activation_patching._run`:
     a slice-assign on `model.layers_output[i]` is sufficient to register the
     intervention and have it propagate through subsequent layers — no
@@ -157,33 +338,52 @@ def _run_causal_mediation(
                 src_hidden = model.layers_output[src_layer][0, src_token_pos].save()
 
             # 2) Target pass — at tgt_layer, slice-assign the source residual
-            #    into the target's tgt_token_pos. project_on_vocab at every
+            #    into the target's tgt_token_pos. project_on_vocab over every
             #    layer gives us a logit-lens grid over the patched pass.
             with model.trace(tgt_prompt):
-                per_layer_logits = []
+                hiddens = []
                 for i in range(n_layers):
                     hs = model.layers_output[i]
                     if i == tgt_layer:
                         hs[0, tgt_token_pos][:] = src_hidden
-                    per_layer_logits.append(model.project_on_vocab(hs))
-                # Stack to a single [L, T, V] tensor so backend() returns a
-                # known shape on the remote path (one saved key: "logits").
-                logits = torch.cat(per_layer_logits, dim=0).save()
+                    hiddens.append(hs)
+
+                # Two tiled passes: top-k (and entropy) per cell, then the
+                # probabilities of each position's tracked ids at every layer.
+                top = layer_lens_reductions(
+                    model.project_on_vocab, hiddens, top_k=top_k, entropy=include_entropy
+                )
+                tracked_ids = union_ids_per_position(top["top_ids"])
+                tracked = layer_lens_reductions(
+                    model.project_on_vocab, hiddens, gather_ids=tracked_ids
+                )
+
+                # One saved key ("lens") so backend() returns a known shape
+                # on the remote path. Only the reductions cross the wire, on
+                # the CPU; ids fit in int32, halving their share of it.
+                lens = {
+                    "top_ids": top["top_ids"].to(torch.int32).cpu(),
+                    "entropy": top["entropy"].cpu() if include_entropy else None,
+                    "tracked_ids": tracked_ids.to(torch.int32).cpu(),
+                    "tracked_probs": tracked["gathered_probs"].cpu(),
+                }.save()
 
     if remote and backend is not None:
         return {"job_id": backend.job_id}
 
-    return {"logits": logits}
+    return {"lens": lens}
 
 
 @router.post("/start", response_model=CausalMediationResponse)
 async def start_causal_mediation(
     req: CausalMediationRequest,
+    labels: LabelMode = LabelMode.TEXT,
     state: AppState = Depends(get_state),
     user_email: str = Depends(require_user_email),
 ):
-    model = state[req.model]
-    _validate_indices(req, model)
+    model = await state.aget_model(req.model)
+    handle = state.get_handle(req.model)
+    _validate_indices(req, handle)
     backend = state.make_backend(model=model)
 
     raw = _run_causal_mediation(
@@ -194,6 +394,8 @@ async def start_causal_mediation(
         req.src_layer,
         req.tgt_token_pos,
         req.tgt_layer,
+        top_k=req.topk,
+        include_entropy=req.include_entropy,
         remote=state.remote,
         backend=backend,
     )
@@ -201,15 +403,15 @@ async def start_causal_mediation(
     if "job_id" in raw:
         return {"job_id": raw["job_id"]}
 
-    input_tokens = _decode_input_tokens(model.tokenizer, req.tgt_prompt)
+    input_tokens = handle.prompt_labels(req.tgt_prompt, labels == LabelMode.IDS)
     data = _format_lens(
-        raw["logits"],
-        tokenizer=model.tokenizer,
+        raw["lens"],
+        handle=handle,
         model_name=req.model,
         input_tokens=input_tokens,
         n_layers=model.num_layers,
-        top_k=req.topk,
         include_entropy=req.include_entropy,
+        labels=labels,
     )
     return {"data": data}
 
@@ -218,6 +420,7 @@ async def start_causal_mediation(
 async def collect_causal_mediation(
     job_id: str,
     req: CausalMediationRequest,
+    labels: LabelMode = LabelMode.TEXT,
     state: AppState = Depends(get_state),
     user_email: str = Depends(require_user_email),
 ):
@@ -225,26 +428,77 @@ async def collect_causal_mediation(
     results = backend()
 
     # The model can be deregistered from the catalog (NDIF stopped serving it)
-    # between /start and /results; state[...] raises KeyError in that case.
+    # between /start and /results; aget_handle raises KeyError in that case.
     # Surface a clear 503 instead of an opaque 500.
     try:
-        model = state[req.model]
+        handle = await state.aget_handle(req.model)
     except KeyError:
         raise HTTPException(
             status_code=503,
             detail=f"Model {req.model} is no longer available; please re-run.",
         )
-    tokenizer = model.tokenizer
-    input_tokens = _decode_input_tokens(tokenizer, req.tgt_prompt)
+    input_tokens = handle.prompt_labels(req.tgt_prompt, labels == LabelMode.IDS)
 
     data = _format_lens(
-        results["logits"],
-        tokenizer=tokenizer,
+        results["lens"],
+        handle=handle,
         model_name=req.model,
         input_tokens=input_tokens,
-        n_layers=model.num_layers,
-        top_k=req.topk,
+        n_layers=handle.num_layers,
         include_entropy=req.include_entropy,
+        labels=labels,
     )
 
     return {"data": data}
+
+
+@router.post("/start-sweep", response_model=CausalMediationSweepResponse)
+async def start_causal_mediation_sweep(
+    req: CausalMediationSweepRequest,
+    state: AppState = Depends(get_state),
+    user_email: str = Depends(require_user_email),
+):
+    model = await state.aget_model(req.model)
+    handle = state.get_handle(req.model)
+    src_layers, tgt_layers = _sweep_layers(req, handle)
+    backend = state.make_backend(model=model)
+
+    raw = _run_causal_mediation_sweep(
+        model,
+        req.src_prompt,
+        req.tgt_prompt,
+        req.src_token_pos,
+        req.tgt_token_pos,
+        src_layers,
+        tgt_layers,
+        req.target_id,
+        remote=state.remote,
+        backend=backend,
+    )
+
+    if "job_id" in raw:
+        return {"job_id": raw["job_id"]}
+
+    return {"data": _format_sweep(raw["sweep"], handle, src_layers, tgt_layers)}
+
+
+@router.post("/results-sweep/{job_id}", response_model=CausalMediationSweepResponse)
+async def collect_causal_mediation_sweep(
+    job_id: str,
+    req: CausalMediationSweepRequest,
+    state: AppState = Depends(get_state),
+    user_email: str = Depends(require_user_email),
+):
+    backend = state.make_backend(job_id=job_id)
+    results = backend()
+
+    try:
+        handle = await state.aget_handle(req.model)
+    except KeyError:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Model {req.model} is no longer available; please re-run.",
+        )
+    src_layers, tgt_layers = _sweep_layers(req, handle)
+
+    return {"data": _format_sweep(results["sweep"], handle, src_layers, tgt_layers)}
@@ -1,13 +1,18 @@
+import asyncio
 import math
 from enum import Enum
 
 import torch as t
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from nnterp import StandardizedTransformer
 from pydantic import BaseModel
 
+from .. import columnar
 from ..auth import require_user_email, user_has_model_access
-from ..data_models import NDIFResponse, Token
+from ..data_models import LabelMode, NDIFResponse, Token
+from ..result_cache import ResultCache
 from ..state import AppState, get_state
+from ..vocab_projection import layer_lens_reductions, project_on_vocab, rank_of
 
 ############ LINE ############
 
@@ -40,23 +45,17 @@ class LensLineResponse(NDIFResponse):
 router = APIRouter()
 
 
-def line(req: LensLineRequest, state: AppState) -> list[t.Tensor]:
-    model = state[req.model]
+def line(
+    model: StandardizedTransformer, req: LensLineRequest, state: AppState
+) -> list[t.Tensor]:
     idx = req.token.idx
     target_ids = req.token.target_ids
 
-    def _compute_top_probs(logits):
-        return t.nn.functional.softmax(logits, dim=-1)
+    def _compute_top_probs(logits_LV, target_ids_LX):
+        return t.nn.functional.softmax(logits_LV, dim=-1).gather(-1, target_ids_LX)
 
-    def _compute_rank(logits):
-        sorted_probs, sorted_indices = t.nn.functional.softmax(logits, dim=-1).sort(descending=True, dim=-1)
-        rank_map = t.empty_like(sorted_indices)
-        rank_map.scatter_(
-            -1,
-            sorted_indices,
-            t.arange(1, logits.size(-1)+1).expand_as(sorted_indices).to(logits.device)
-        )
-        return rank_map
+    def _compute_rank(logits_LV, target_ids_LX):
+        return rank_of(logits_LV, target_ids_LX)
 
     if req.stat == LensStatistic.PROBABILITY:
         _compute_func = _compute_top_probs
@@ -68,18 +67,18 @@ def line(req: LensLineRequest, state: AppState) -> list[t.Tensor]:
         remote=state.remote,
         backend=state.make_backend(model=model),
     ) as tracer:
-        results = []
+        hiddens = []
         for layer in model.model.layers:
             hidden_BLD = layer.output
             if isinstance(hidden_BLD, tuple):
                 hidden_BLD = hidden_BLD[0]
-            logits_BLV = model.lm_head(model.model.ln_f(hidden_BLD))
-            logits_V = logits_BLV[0, idx, :]
-            metrics = _compute_func(logits_V)
+            hiddens.append(hidden_BLD[:, idx, :])
 
-            target_ids_tensor = t.tensor(target_ids).to(metrics.device)
-            target_probs_X = t.gather(metrics, 0, target_ids_tensor)
-            results.append(target_probs_X)
+        # All layers at once: [L, D] residuals -> [L, V] logits -> [L, X]
+        # metrics for the targets.
+        logits_LV = project_on_vocab(model, hiddens)
+        target_ids_LX = t.tensor(target_ids, device=logits_LV.device).expand(logits_LV.size(0), -1)
+        results = _compute_func(logits_LV, target_ids_LX)
 
         results.save()
 
@@ -99,9 +98,12 @@ def process_line_results(
     results: list[t.Tensor],
     req: LensLineRequest,
     state: AppState,
+    labels: LabelMode = LabelMode.TEXT,
 ):
-    tok = state[req.model].tokenizer
-    target_token_strs = tok.batch_decode(req.token.target_ids)
+    handle = state.get_handle(req.model)
+    target_token_strs = handle.label_ids(
+        req.token.target_ids, labels == LabelMode.IDS
+    ).tolist()
 
     lines = []
 
@@ -120,9 +122,25 @@ def process_line_results(
     return lines
 
 
+def line_columns(results: t.Tensor, req: LensLineRequest, state: AppState, media_type: str):
+    """Columnar alternative to ``process_line_results``: ``values`` is
+    ``[X, L]`` (one row per target id in ``target_ids``)."""
+    handle = state.get_handle(req.model)
+    target_ids = t.tensor(req.token.target_ids)
+
+    return columnar.encode(
+        {"values": results.T, "target_ids": target_ids},
+        media_type,
+        stat=req.stat.value,
+        labels=columnar.label_table(handle, target_ids),
+    )
+
+
 @router.post("/start-line", response_model=LensLineResponse)
 async def start_line(
     req: LensLineRequest,
+    request: Request,
+    labels: LabelMode = LabelMode.TEXT,
     state: AppState = Depends(get_state),
     user_email: str = Depends(require_user_email)
 ):
@@ -132,31 +150,43 @@ async def start_line(
             message = f"User does not have access to {req.model}"
             raise HTTPException(status_code=403, detail=message)
 
+    model = await state.aget_model(req.model)
+
     try:
-        result = line(req, state)
+        result = line(model, req, state)
     except Exception as e:
         raise e
 
     if state.remote:
         return {"job_id": result}
 
-    return {"data": process_line_results(result, req, state)}
+    if media_type := columnar.negotiate(request):
+        return line_columns(result, req, state, media_type)
+
+    return {"data": process_line_results(result, req, state, labels)}
 
 
 @router.post("/results-line/{job_id}", response_model=LensLineResponse)
 async def collect_line(
     job_id: str,
     req: LensLineRequest,
+    request: Request,
+    labels: LabelMode = LabelMode.TEXT,
     state: AppState = Depends(get_state),
     user_email: str = Depends(require_user_email)
 ):
 
+    await state.aget_handle(req.model)
+
     try:
         results = get_remote_line(user_email, job_id, state)
     except Exception as e:
         raise e
 
-    return {"data": process_line_results(results, req, state)}
+    if media_type := columnar.negotiate(request):
+        return line_columns(results, req, state, media_type)
+
+    return {"data": process_line_results(results, req, state, labels)}
 
 ############ GRID ############
 
@@ -180,104 +210,105 @@ class GridLensResponse(NDIFResponse):
 
 
 def heatmap(
-    req: GridLensRequest, state: AppState
-) -> tuple[list[t.Tensor], list[t.Tensor]]:
-    model = state[req.model]
-
-    def _compute_top_probs(hs_decoded, logits):
-        pred_ids = []
-        probs = []
-
-        for hs in hs_decoded:
-            relevant_tokens_LV = hs[0, :, :]
-            probs_LV = t.nn.functional.softmax(relevant_tokens_LV, dim=-1)
-            pred_ids_L = relevant_tokens_LV.argmax(dim=-1)
-            pred_ids_L1 = pred_ids_L.unsqueeze(1)
-            probs_L = t.gather(probs_LV, 1, pred_ids_L1).squeeze()
-            pred_ids.append(pred_ids_L.tolist())
-            probs.append(probs_L.tolist())
-
-        return probs, pred_ids
-
-    def _compute_rank(hs_decoded, logits):
-        ranks = []
-        top_tokens = logits.argmax(dim=-1)
-
-        for hs in hs_decoded:
-            sorted_probs, sorted_indices = t.nn.functional.softmax(hs, dim=-1).sort(descending=True, dim=-1)
-            rank_map = t.empty_like(sorted_indices)
-            rank_map.scatter_(
-                2,
-                sorted_indices,
-                t.arange(1, logits.size(-1)+1).expand_as(sorted_indices).to(hs.device)
-            )
-            ranks_L = rank_map.gather(2, top_tokens.unsqueeze(-1)).squeeze(-1)
-            ranks.append(ranks_L[0].to("cpu").tolist())
-
-        return ranks, top_tokens[0].to('cpu').tolist()
-
-    def _compute_entropy(hs_decoded, logits):
-        entropies = []
-
-        for hs in hs_decoded:
-            hs = hs[0, :, :]
-            log_p = t.nn.functional.log_softmax(hs, dim=-1)
-            p = log_p.exp()
-            H = -(p * log_p).sum(dim=-1)
-            entropies.append(H.to("cpu").tolist())
-
-        return entropies, logits.argmax(dim=-1)[0].to("cpu").tolist()
+    model: StandardizedTransformer, req: GridLensRequest, state: AppState
+) -> dict[str, t.Tensor]:
+    """Trace the lens grid for every ``LensStatistic`` in one forward pass.
 
-    if req.stat == LensStatistic.PROBABILITY:
-        _compute_func = _compute_top_probs
-    elif req.stat == LensStatistic.RANK:
-        _compute_func = _compute_rank
-    elif req.stat == LensStatistic.ENTROPY:
-        _compute_func = _compute_entropy
+    The statistic in ``req`` only matters when formatting, so the saved grid
+    is cached per (model, prompt) and a later switch of ``stat`` is served
+    by ``process_grid_results`` without tracing again.
+
+    Returns:
+        The job ID in remote mode; otherwise the grid — ``[L, T]`` CPU
+        tensors ``top_probs`` / ``top_ids`` (top-1 per cell), ``ranks`` (of
+        the final prediction) and ``entropy``, plus ``pred_ids`` ``[T]``.
+    """
+
+    def _project(hidden_ND):
+        return model.lm_head(model.model.ln_f(hidden_ND))
 
     with model.trace(
         req.prompt,
         remote=state.remote,
         backend=state.make_backend(model=model),
     ) as tracer:
-        hs_decoded = []
+        hiddens = []
 
         for layer in model.model.layers[:-1]:
             hs = layer.output
             if isinstance(hs, tuple):
                 hs = hs[0]
-            hs_decoded.append(model.lm_head(model.model.ln_f(hs)))
+            hiddens.append(hs)
 
+        # Intermediate layers' residuals plus the model's own final logits
+        # (the last grid row), reduced tile by tile so the [L, T, V] logits
+        # are never held at once. One pass keeps every statistic.
         logits = model.output.logits
-        hs_decoded.append(logits)
+        pred_ids_T = logits[0].argmax(dim=-1)
+        lens = layer_lens_reductions(
+            _project, hiddens, logits, top_k=1, target_ids=pred_ids_T, entropy=True
+        )
 
-        stats, pred_ids = _compute_func(hs_decoded, logits)
-        stats.save()
-        pred_ids.save()
+        # One saved key ("grid") so backend() returns a known shape on the
+        # remote path.
+        grid = {
+            "top_probs": lens["top_probs"][..., 0].to("cpu"),
+            "top_ids": lens["top_ids"][..., 0].to("cpu"),
+            "ranks": lens["target_ranks"].to("cpu"),
+            "entropy": lens["entropy"].to("cpu"),
+            "pred_ids": pred_ids_T.to("cpu"),
+        }.save()
 
     if state.remote:
         return tracer.backend.job_id
 
-    return stats, pred_ids
+    return grid
 
 def get_remote_heatmap(
     user_email: str,
     job_id: str,
     state: AppState
-) -> tuple[list[t.Tensor], list[t.Tensor]]:
+) -> dict[str, t.Tensor]:
     backend = state.make_backend(job_id=job_id)
     results = backend()
-    return results["stats"], results["pred_ids"]
+    return results["grid"]
+
+
+def _grid_key(model: str, prompt: str) -> str:
+    return ResultCache.key(model, "lens/grid", {"prompt": prompt})
+
+
+async def get_cached_grid(state: AppState, model: str, prompt: str) -> dict[str, t.Tensor] | None:
+    """The grid for (model, prompt) from ``state.results``, as CPU tensors."""
+    cached = await asyncio.to_thread(state.results.get, _grid_key(model, prompt))
+    if cached is None:
+        return None
+    return {name: t.tensor(values) for name, values in cached.items()}
+
+
+async def cache_grid(state: AppState, model: str, prompt: str, grid: dict[str, t.Tensor]) -> None:
+    """Store every statistic of the grid, so any ``stat`` is served from it."""
+    lists = {name: tensor.tolist() for name, tensor in grid.items()}
+    await asyncio.to_thread(state.results.put, _grid_key(model, prompt), lists)
 
 
 def process_grid_results(
-    stats: list[t.Tensor],
-    pred_ids: list[t.Tensor],
+    grid: dict[str, t.Tensor],
     lens_request: GridLensRequest,
     state: AppState,
+    labels: LabelMode = LabelMode.TEXT,
 ):
-    tok = state[lens_request.model].tokenizer
-    input_strs = tok.batch_decode(tok.encode(lens_request.prompt))
+    handle = state.get_handle(lens_request.model)
+    as_ids = labels == LabelMode.IDS
+    input_strs = handle.prompt_labels(lens_request.prompt, as_ids)
+
+    if lens_request.stat == LensStatistic.PROBABILITY:
+        stats = grid["top_probs"].tolist()
+        # One table gather for every [layer][seq] label.
+        pred_strs = handle.label_ids(grid["top_ids"], as_ids).tolist()
+    else:
+        stats = grid["ranks" if lens_request.stat == LensStatistic.RANK else "entropy"].tolist()
+        pred_strs = handle.label_ids(grid["pred_ids"], as_ids).tolist()
 
     rows = []
     for seq_idx, input_str in enumerate(input_strs):
@@ -286,9 +317,9 @@ def process_grid_results(
                 GridCell(
                     x=layer_idx,
                     y=stat[seq_idx],
-                    label=tok.decode(pred_id[seq_idx]),
+                    label=pred_str[seq_idx],
                 )
-                for layer_idx, (stat, pred_id) in enumerate(zip(stats, pred_ids))
+                for layer_idx, (stat, pred_str) in enumerate(zip(stats, pred_strs))
             ]
             rows.append(GridRow(id=f"{input_str}-{seq_idx}", data=points))
         elif lens_request.stat == LensStatistic.RANK:
@@ -300,7 +331,7 @@ def process_grid_results(
                 )
                 for layer_idx, stat in enumerate(stats)
             ]
-            rows.append(GridRow(id=f"{input_str}-{seq_idx}", data=points, right_axis_label=tok.decode(pred_ids[seq_idx])))
+            rows.append(GridRow(id=f"{input_str}-{seq_idx}", data=points, right_axis_label=pred_strs[seq_idx]))
         elif lens_request.stat == LensStatistic.ENTROPY:
             points = [
                 GridCell(
@@ -310,14 +341,62 @@ def process_grid_results(
                 )
                 for layer_idx, stat in enumerate(stats)
             ]
-            rows.append(GridRow(id=f"{input_str}-{seq_idx}", data=points, right_axis_label=tok.decode(pred_ids[seq_idx])))
+            rows.append(GridRow(id=f"{input_str}-{seq_idx}", data=points, right_axis_label=pred_strs[seq_idx]))
 
     return rows
 
 
+def grid_columns(
+    grid: dict[str, t.Tensor],
+    lens_request: GridLensRequest,
+    state: AppState,
+    media_type: str,
+):
+    """Columnar alternative to ``process_grid_results``.
+
+    ``values`` is ``[T, L]`` — one row per input token, as in ``GridRow`` —
+    holding the raw statistic (ranks are not log-scaled; the client formats
+    labels from the values). ``input_ids`` are the row tokens. For
+    ``probability`` each cell's predicted token is in ``label_ids``
+    ``[T, L]``; otherwise the final prediction per row is in ``pred_ids``.
+    """
+    handle = state.get_handle(lens_request.model)
+    input_ids = t.tensor(handle.encode(lens_request.prompt))
+
+    if lens_request.stat == LensStatistic.PROBABILITY:
+        values = grid["top_probs"].T
+        id_arrays = {"label_ids": grid["top_ids"].T}
+    else:
+        values = grid["ranks" if lens_request.stat == LensStatistic.RANK else "entropy"].T
+        id_arrays = {"pred_ids": grid["pred_ids"]}
+
+    return columnar.encode(
+        {"values": values, "input_ids": input_ids, **id_arrays},
+        media_type,
+        stat=lens_request.stat.value,
+        labels=columnar.label_table(handle, input_ids, *id_arrays.values()),
+    )
+
+
+def grid_response(
+    grid: dict[str, t.Tensor],
+    lens_request: GridLensRequest,
+    request: Request,
+    state: AppState,
+    labels: LabelMode = LabelMode.TEXT,
+):
+    """Columnar when the client negotiated it via ``Accept``, else nested rows."""
+    if media_type := columnar.negotiate(request):
+        return grid_columns(grid, lens_request, state, media_type)
+
+    return {"data": process_grid_results(grid, lens_request, state, labels)}
+
+
 @router.post("/start-grid", response_model=GridLensResponse)
 async def get_grid(
     req: GridLensRequest,
+    request: Request,
+    labels: LabelMode = LabelMode.TEXT,
     state: AppState = Depends(get_state),
     user_email: str = Depends(require_user_email)
 ):
@@ -326,28 +405,58 @@ async def get_grid(
             message = f"User does not have access to {req.model}"
             raise HTTPException(status_code=403, detail=message)
 
+    # Every statistic was saved by the first trace of this prompt; switching
+    # ``stat`` is formatted from the cache with no forward pass or NDIF job.
+    await state.aget_handle(req.model)
+    grid = await get_cached_grid(state, req.model, req.prompt)
+    if grid is not None:
+        return grid_response(grid, req, request, state, labels)
+
+    model = await state.aget_model(req.model)
+
     try:
-        result = heatmap(req, state)
+        result = heatmap(model, req, state)
     except Exception as e:
         raise e
 
     if state.remote:
+        # ``/results-grid`` caches the job's grid under this (model, prompt),
+        # never the one in its own request body.
+        state.pending_results.add(result, user_email, (req.model, req.prompt))
         return {"job_id": result}
 
-    probs, pred_ids = result
-    return {"data": process_grid_results(probs, pred_ids, req, state)}
+    await cache_grid(state, req.model, req.prompt, result)
+    return grid_response(result, req, request, state, labels)
 
 
 @router.post("/results-grid/{job_id}", response_model=GridLensResponse)
 async def collect_grid(
     job_id: str,
     lens_request: GridLensRequest,
+    request: Request,
+    labels: LabelMode = LabelMode.TEXT,
     state: AppState = Depends(get_state),
     user_email: str = Depends(require_user_email)
 ):
+    # The model can leave the catalog between /start-grid and here.
     try:
-        probs, pred_ids = get_remote_heatmap(user_email, job_id, state)
+        await state.aget_handle(lens_request.model)
+    except KeyError:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Model {lens_request.model} is no longer available; please re-run.",
+        )
+
+    try:
+        grid = get_remote_heatmap(user_email, job_id, state)
     except Exception as e:
         raise e
 
-    return {"data": process_grid_results(probs, pred_ids, lens_request, state)}
+    # ``heatmap``'s cache is trusted without a trace, so only the job's own
+    # (model, prompt) recorded at /start-grid may be written.
+    pending = state.pending_results.pop(job_id, user_email)
+    if pending is not None:
+        model, prompt = pending
+        await cache_grid(state, model, prompt, grid)
+
+    return grid_response(grid, lens_request, request, state, labels)
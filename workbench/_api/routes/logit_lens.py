@@ -1,7 +1,11 @@
-from fastapi import APIRouter, Depends
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
 from ..state import AppState, get_state
-from ..auth import require_user_email
+from ..auth import require_user_email, user_has_model_access
+from ..result_cache import ResultCache, get_top_k, put_top_k
 
 from ..data_models import NDIFResponse
 
@@ -17,6 +21,16 @@ class LogitLensRequest(BaseModel):
     include_entropy: bool = True  # Whether to include entropy data
 
 
+def _result_key(req: LogitLensRequest) -> str:
+    """Cache key for ``req``; ``topk`` is left out so a smaller k is sliced
+    from a cached larger one."""
+    return ResultCache.key(
+        req.model,
+        "logit_lens",
+        {"prompt": req.prompt, "include_entropy": req.include_entropy},
+    )
+
+
 class LogitLensResponse(NDIFResponse):
     data: LogitLensData | None = None
 
@@ -27,16 +41,33 @@ async def start_logit_lens(
     state: AppState = Depends(get_state),
     user_email: str = Depends(require_user_email),
 ):
-    model = state[req.model]
+    # Checked here rather than left to NDIF, since a cache hit never
+    # reaches NDIF.
+    if state.remote and not user_has_model_access(user_email, req.model, state):
+        raise HTTPException(
+            status_code=403, detail=f"User does not have access to {req.model}"
+        )
+
+    # Same request seen before: answer from the cache, with no trace or job.
+    cached = await asyncio.to_thread(get_top_k, state.results, _result_key(req), req.topk)
+    if cached is not None:
+        return {"data": cached}
+
+    model = await state.aget_model(req.model)
     backend = state.make_backend(model=model)
 
     output = logit_lens._run(model, req.prompt, remote=state.remote, backend=backend, non_blocking=state.remote, raw=False, top_k=req.topk)
 
     if not backend.blocking:
+        # ``/results`` caches under this key, never one built from its body.
+        state.pending_results.add(output, user_email, (_result_key(req), req.topk))
         return {"job_id": output}
 
 
-    return {"data": logit_lens.to_data_obj(**output)}
+    data = jsonable_encoder(logit_lens.to_data_obj(**output))
+    await asyncio.to_thread(put_top_k, state.results, _result_key(req), req.topk, data)
+
+    return {"data": data}
 
 
 @router.post("/results/{job_id}", response_model=LogitLensResponse)
@@ -49,6 +80,11 @@ async def collect_logit_lens(
     backend = state.make_backend(job_id=job_id)
     results = backend()['results']
 
-    data = logit_lens.to_data_obj(**results)
+    data = jsonable_encoder(logit_lens.to_data_obj(**results))
+
+    pending = state.pending_results.pop(job_id, user_email)
+    if pending is not None:
+        key, top_k = pending
+        await asyncio.to_thread(put_top_k, state.results, key, top_k, data)
 
     return {"data": data}
\ No newline at end of file
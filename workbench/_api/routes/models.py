@@ -1,15 +1,18 @@
+import asyncio
 import logging
+import re
 import time
 
 import requests
 import torch as t
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from nnterp import StandardizedTransformer
 from pydantic import BaseModel
 
 from nnsightful.tools.j_lens import j_lens
 
 from ..auth import get_user_email, require_user_email, user_has_model_access
-from ..data_models import NDIFResponse, Token, ModelHeat
+from ..data_models import LabelMode, NDIFResponse, Token, ModelHeat
 from ..telemetry import TelemetryClient, RequestStatus
 from ..state import AppState, get_state
 
@@ -20,6 +23,14 @@ router = APIRouter()
 MODELS_LAST_UPDATED = 0
 MODEL_INTERVAL = 30
 
+# ``get_readiness`` preload status -> heat shown for a local model.
+LOCAL_PRELOAD_HEAT = {
+    "ready": ModelHeat.HOT,
+    "loading": ModelHeat.DEPLOYING,
+    "pending": ModelHeat.DEPLOYING,
+    "failed": ModelHeat.COLD,
+}
+
 
 def _refresh_catalog(state: AppState) -> None:
     """Hit NDIF /status and rebuild the catalog of deployed models. Caches
@@ -107,9 +118,12 @@ async def get_models(
         models = get_remote_models(state, is_user_signed_in)
     else:
         models = state.get_all_model_list()
-        # Local models are fully loaded on the dev backend, so they're effectively hot.
+        # Pinned models report their background preload; the rest load on
+        # first use, so they're effectively hot.
+        preload = state.get_readiness()["models"]
         for model in models:
-            model['status'] = ModelHeat.HOT.value
+            status = preload.get(model.get("name"), {}).get("status", "ready")
+            model['status'] = LOCAL_PRELOAD_HEAT[status].value
         
     ## JLens supported models
     try:
@@ -123,6 +137,65 @@ async def get_models(
     return models
 
 
+@router.get("/memory")
+async def get_memory_usage(state: AppState = Depends(get_state)):
+    """Resident size of each loaded model wrapper against the eviction budget."""
+    return state.get_memory_usage()
+
+
+@router.get("/vocab/{model_name:path}")
+async def get_vocab(
+    model_name: str,
+    request: Request,
+    state: AppState = Depends(get_state),
+    user_email: str = Depends(require_user_email),
+):
+    """Every token id's label, for clients requesting ``labels=ids``.
+
+    Fetched once per model: the response carries an ETag, and a matching
+    ``If-None-Match`` gets an empty 304.
+    """
+    if state.remote and not user_has_model_access(user_email, model_name, state):
+        raise HTTPException(
+            status_code=403, detail=f"User does not have access to {model_name}"
+        )
+
+    handle = await state.aget_handle(model_name)
+    # The first call decodes the whole vocabulary.
+    body, etag = await asyncio.to_thread(handle.vocab_payload)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if _etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+# One entity tag of an If-None-Match list (optional weak prefix, quoted tag)
+# and the whole list. Tags may contain commas, so the list is matched
+# rather than split.
+_ENTITY_TAG = re.compile(r'(?:W/)?"[^"]*"')
+_ENTITY_TAG_LIST = re.compile(rf"\s*{_ENTITY_TAG.pattern}(?:\s*,\s*{_ENTITY_TAG.pattern})*\s*")
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether an ``If-None-Match`` header value matches ``etag``.
+
+    ``*`` matches any tag; otherwise each listed tag is compared exactly,
+    ignoring the ``W/`` prefix (the weak comparison RFC 9110 prescribes
+    for this header). A malformed value matches nothing.
+    """
+    if if_none_match.strip() == "*":
+        return True
+    if not _ENTITY_TAG_LIST.fullmatch(if_none_match):
+        return False
+
+    opaque = etag.removeprefix("W/")
+    return any(
+        tag.removeprefix("W/") == opaque for tag in _ENTITY_TAG.findall(if_none_match)
+    )
+
+
 class LensCompletion(BaseModel):
     model: str
     prompt: str
@@ -130,9 +203,8 @@ class LensCompletion(BaseModel):
 
 
 def prediction(
-    req: LensCompletion, state: AppState
+    model: StandardizedTransformer, req: LensCompletion, state: AppState
 ) -> tuple[t.Tensor, t.Tensor] | str:
-    model = state[req.model]
     idx = req.token.idx
 
     with model.trace(
@@ -180,8 +252,9 @@ def process_prediction(
     indices_LV: t.Tensor,
     req: LensCompletion,
     state: AppState,
+    labels: LabelMode = LabelMode.TEXT,
 ):
-    tok = state[req.model].tokenizer
+    handle = state.get_handle(req.model)
     idxs = [req.token.idx]
 
     # Round values to 2 decimal places
@@ -190,7 +263,7 @@ def process_prediction(
 
     nonzero_values = idx_values[nonzero].tolist()
     nonzero_indices = indices_LV[0][nonzero].tolist()
-    nonzero_texts = tok.batch_decode(nonzero_indices)
+    nonzero_texts = handle.label_ids(nonzero_indices, labels == LabelMode.IDS).tolist()
 
     prediction = Prediction(
         idx=idxs[0],
@@ -205,6 +278,7 @@ def process_prediction(
 @router.post("/start-prediction", response_model=PredictionResponse)
 async def start_prediction(
     prediction_request: LensCompletion, 
+    labels: LabelMode = LabelMode.TEXT,
     state: AppState = Depends(get_state),
     user_email: str = Depends(require_user_email)
 ):
@@ -227,8 +301,10 @@ async def start_prediction(
         type="NEXT_TOKEN",
     )
 
+    model = await state.aget_model(prediction_request.model)
+
     try:
-        result = prediction(prediction_request, state)
+        result = prediction(model, prediction_request, state)
     except Exception as e:
         TelemetryClient.log_request(
             RequestStatus.ERROR, 
@@ -250,7 +326,7 @@ async def start_prediction(
         return {"job_id": result}
 
     values_LV, indices_LV = result
-    data = process_prediction(values_LV, indices_LV, prediction_request, state)
+    data = process_prediction(values_LV, indices_LV, prediction_request, state, labels)
     return {"data": data}
 
 
@@ -258,13 +334,16 @@ async def start_prediction(
 async def results_prediction(
     job_id: str,
     prediction_request: LensCompletion,
+    labels: LabelMode = LabelMode.TEXT,
     state: AppState = Depends(get_state),
     user_email: str = Depends(require_user_email)
 ):
 
+    await state.aget_handle(prediction_request.model)
+
     try:
         values_LV, indices_LV = get_remote_prediction(job_id, state)
-        data = process_prediction(values_LV, indices_LV, prediction_request, state)
+        data = process_prediction(values_LV, indices_LV, prediction_request, state, labels)
     except Exception as e:
         TelemetryClient.log_request(
             RequestStatus.ERROR, 
@@ -302,8 +381,7 @@ class GenerationResponse(NDIFResponse):
     data: Generation | None = None
 
 
-def generate(req: Completion, state: AppState):
-    model = state[req.model]
+def generate(model: StandardizedTransformer, req: Completion, state: AppState):
     last_iter = req.max_new_tokens - 1
     with model.generate(
         req.prompt,
@@ -343,8 +421,8 @@ def process_generation_results(
     req: Completion,
     state: AppState,
 ):
-    tok = state[req.model].tokenizer
-    new_token_text = tok.batch_decode(new_token_ids)
+    handle = state.get_handle(req.model)
+    new_token_text = handle.decode_ids(new_token_ids).tolist()
 
     tokens = [
         Token(idx=i, id=new_token_ids[i].item(), text=text, targetIds=[])
@@ -357,7 +435,7 @@ def process_generation_results(
 
     nonzero_values = idx_values[nonzero].tolist()
     nonzero_indices = indices_V[nonzero].tolist()
-    nonzero_texts = tok.batch_decode(nonzero_indices)
+    nonzero_texts = handle.decode_ids(nonzero_indices).tolist()
 
     last_token_prediction = Prediction(
         idx=new_token_ids[-1],
@@ -398,8 +476,10 @@ async def start_generate(
         type="NEXT_TOKEN",
     )
 
+    model = await state.aget_model(req.model)
+
     try:
-        result = generate(req, state)
+        result = generate(model, req, state)
     except Exception as e:
         TelemetryClient.log_request(
             RequestStatus.ERROR, 
@@ -437,6 +517,8 @@ async def results_generate(
     user_email: str = Depends(require_user_email)
 ):
 
+    await state.aget_handle(req.model)
+
     try:
         values_V, indices_V, new_token_ids = get_remote_generate(job_id, state)
         data = process_generation_results(
@@ -2,16 +2,28 @@ from itertools import chain
 from typing import List, NamedTuple
 import asyncio
 
-import einops
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Depends, HTTPException, Request
 from nnterp import StandardizedTransformer
-import nnsight as ns
 import torch as t
-from transformers import AutoTokenizer
 
 from pydantic import BaseModel, ConfigDict, Field, model_validator
 from typing import Optional, Literal
 
+from ..auth import get_user_email, require_user_email, user_has_model_access
+from ..data_models import NDIFResponse
+from ..jobs import JobRegistry, LocalJob
+from ..patching import (
+    EPS,
+    PATCH_MAX_BATCH,
+    attribution_effect,
+    batched_metric,
+    clean_baselines,
+    get_prob,
+    logit_difference,
+    skip_clean_layers,
+)
+from ..state import AppState, ModelHandle, TensorLRU, get_state
+
 
 """
 Dimension key:
@@ -25,7 +37,8 @@ H: number of attention heads in a layer
 Dh: size of each attention head
 """
 
-EPS = 1e-10
+# How often a local run's handler checks whether its client has gone away.
+DISCONNECT_POLL_SECONDS = 1.0
 
 
 class Point(BaseModel):
@@ -63,6 +76,14 @@ class PatchRequest(BaseModel):
     correct_id: int = Field(alias="correctId")
     incorrect_id: Optional[int] = Field(default=None, alias="incorrectId")
 
+    # Estimate every cell from one source pass, one destination pass and one
+    # backward pass instead of patching exactly (see ``attribution_patch``).
+    approximate: bool = False
+
+    # Optional client-chosen ID for a local run, so progress can be polled
+    # and the run cancelled (``/patch/jobs/{job_id}``) while it executes.
+    job_id: Optional[str] = Field(default=None, alias="jobId")
+
     @model_validator(mode="after")
     def validate_request(self):
         if self.submodule == "heads" and self.patch_tokens:
@@ -75,6 +96,13 @@ class PatchResponse(BaseModel):
     results: List[List[float]]
     rowLabels: List[str | int] = Field(default_factory=list)
     colLabels: List[str | int] = Field(default_factory=list)
+    # True when ``results`` are first-order estimates, not exact patches.
+    # No error bound is computed; refine interesting cells exactly.
+    approximate: bool = False
+
+
+class PatchGridResponse(NDIFResponse):
+    data: PatchResponse | None = None
 
 
 def get_components(model: StandardizedTransformer, patching_request: PatchRequest):
@@ -90,228 +118,337 @@ def get_components(model: StandardizedTransformer, patching_request: PatchReques
             raise ValueError(f"Invalid submodule: {patching_request.submodule}")
 
 
-def logit_difference(model: StandardizedTransformer, patching_request: PatchRequest):
-    logits = model.logits
-    return (
-        logits[0, -1, patching_request.correct_id]
-        - logits[0, -1, patching_request.incorrect_id]
-    )
-
-
-def compute_ioi_metric(source_diff, destination_diff, patched_diff):
-    return (patched_diff - destination_diff) / (
-        (source_diff - destination_diff) + EPS
-    )
-
-
-def get_prob(model: StandardizedTransformer, patching_request: PatchRequest):
-    logits = model.logits
-    probs = t.softmax(logits, dim=-1)
-    return probs[0, -1, patching_request.correct_id]
-
-
-def patch_components(model: StandardizedTransformer, patching_request: PatchRequest):
+def group_patches(chunk: list) -> dict:
+    """Group a chunk of layer-major cells into per-layer index tensors.
+
+    Args:
+        chunk: ``(layer_idx, *idxs)`` cells; a cell's batch row is its
+            position in ``chunk``.
+
+    Returns:
+        ``{layer_idx: (rows, *idxs)}`` with one int64 tensor per field, in
+        execution (layer) order.
+    """
+    grouped = {}
+    for row, (layer_idx, *idxs) in enumerate(chunk):
+        grouped.setdefault(layer_idx, []).append((row, *idxs))
+
+    return {
+        layer_idx: tuple(t.tensor(field) for field in zip(*patches))
+        for layer_idx, patches in grouped.items()
+    }
+
+
+def patch_components(
+    model: StandardizedTransformer,
+    patching_request: PatchRequest,
+    max_batch: int = PATCH_MAX_BATCH,
+    *,
+    remote: bool = False,
+    backend=None,
+    job: LocalJob | None = None,
+    baseline: dict | None = None,
+):
+    """Patch the source output of each layer, separately, into the destination.
+
+    The destination prompt is replicated along the batch dim and row ``i``
+    of a pass patches only the ``i``-th layer of its chunk, so the sweep
+    takes ``ceil(n_layers / max_batch)`` destination passes instead of one
+    per layer. ``max_batch=1`` is the unbatched per-layer sweep. Each pass
+    resumes from its lowest patched layer (``skip_clean_layers``).
+
+    Returns:
+        The NDIF job ID when ``remote``; otherwise the ``[n_layers]`` metric.
+    """
     components = get_components(model, patching_request)
     is_tuple = patching_request.submodule == "blocks"
 
-    source_cache = {}
-
-    with model.wrapped_session():
-        results = ns.list().save()
-
-        with model.trace(patching_request.source):
-            for component in components:
-                hidden_BLD = component.output
-
-                if is_tuple:
-                    hidden_BLD = hidden_BLD[0]
-
-                source_cache[component] = hidden_BLD
-
-            if patching_request.incorrect_id is not None:
-                source_diff = logit_difference(model, patching_request)
-
-        with model.trace(patching_request.destination):
-            destination_diff = logit_difference(model, patching_request)
-
-        for component in components:
-            with model.trace(
-                patching_request.destination,
-            ):
-                if is_tuple:
-                    hidden_BLD_tuple = component.output
-                    component.output = (
-                        source_cache[component],
-                        hidden_BLD_tuple[1],
+    # Plain values only inside the session: it is shipped to NDIF remotely.
+    source = patching_request.source
+    destination = patching_request.destination
+    correct_id = patching_request.correct_id
+    incorrect_id = patching_request.incorrect_id
+
+    source_key = f"source:{patching_request.submodule}"
+
+    if job is not None:
+        job.total = len(components)
+
+    with t.no_grad():
+        # Forward-only sweep: without this each pass's metric would keep
+        # its autograd graph alive until the final cat, so peak memory
+        # would grow with every batched pass rather than ``max_batch``.
+        with model.session(remote=remote, backend=backend):
+            source_stack, clean_outputs, source_diff, destination_diff = clean_baselines(
+                model,
+                components,
+                source,
+                destination,
+                correct_id,
+                incorrect_id,
+                source_key=source_key,
+                is_tuple=is_tuple,
+                baseline=baseline,
+            )
+
+            metrics = []
+            for start in range(0, len(components), max_batch):
+                chunk = components[start:start + max_batch]
+
+                with model.trace([destination] * len(chunk)):
+                    skip_clean_layers(model, clean_outputs, start, len(chunk))
+
+                    for row, component in enumerate(chunk):
+                        if is_tuple:
+                            hidden_BLD_tuple = component.output
+                            hidden_BLD = hidden_BLD_tuple[0]
+                        else:
+                            hidden_BLD = component.output
+
+                        hidden_BLD[row] = source_stack[start + row].to(hidden_BLD.device)
+
+                        if is_tuple:
+                            component.output = (hidden_BLD, hidden_BLD_tuple[1])
+                        else:
+                            component.output = hidden_BLD
+
+                    metrics.append(
+                        batched_metric(model, correct_id, incorrect_id, source_diff, destination_diff)
                     )
-                else:
-                    component.output = source_cache[component]
-
-                if patching_request.incorrect_id is not None:
-                    patched_diff = logit_difference(model, patching_request)
-                    ioi_metric = compute_ioi_metric(
-                        source_diff, destination_diff, patched_diff
-                    )
-                    results.append(ioi_metric)
-                else:
-                    prob = get_prob(model, patching_request)
-                    results.append(prob)
-
-    return PatchResponse(
-        results=[[r] for r in results],
-    )
-
 
-def patch_heads(model: StandardizedTransformer, patching_request: PatchRequest):
+                # Local runs only: the job lives in this process.
+                if job is not None:
+                    job.advance(metrics[-1])
+
+            # Reduced server-side: only the grid of floats comes back.
+            results = t.cat([m.float().cpu() for m in metrics]).save()
+
+    if remote:
+        return backend.job_id
+
+    return results
+
+
+def patch_heads(
+    model: StandardizedTransformer,
+    patching_request: PatchRequest,
+    max_batch: int = PATCH_MAX_BATCH,
+    *,
+    remote: bool = False,
+    backend=None,
+    job: LocalJob | None = None,
+    baseline: dict | None = None,
+):
+    """Patch each attention head's source output into the destination separately.
+
+    (layer, head) cells are swept in layer-major chunks of ``max_batch``
+    destination rows, each row patching a single head at the input of its
+    layer's ``o_proj``. The sweep takes ``ceil(layers * heads / max_batch)``
+    passes instead of one per head; ``max_batch`` bounds the activation
+    memory of each pass. Each pass resumes from its lowest patched layer
+    (``skip_clean_layers``).
+
+    Returns:
+        The NDIF job ID when ``remote``; otherwise the layer-major
+        ``[n_layers * n_heads]`` metric.
+    """
     components = [model.attentions[i].o_proj for i in range(model.num_layers)]
     n_heads = model.num_heads
 
-    source_cache = {}
-
-    with model.wrapped_session():
-        results = ns.dict().save()
-
-        with model.trace(patching_request.source):
-            for component in components:
-                hidden_BLD = component.input
-                hidden_BLHDh = einops.rearrange(
-                    hidden_BLD,
-                    "b l (n_heads d_head) -> b l n_heads d_head",
-                    n_heads=n_heads,
-                )
-
-                for head_idx in range(n_heads):
-                    source_cache[(component, head_idx)] = hidden_BLHDh[
-                        :, :, head_idx, :
-                    ]
-
-                if patching_request.incorrect_id is not None:
-                    source_diff = logit_difference(model, patching_request)
-
-        with model.trace(patching_request.destination):
-            destination_diff = logit_difference(model, patching_request)
-
-        for layer_idx, component in enumerate(components):
-            for head_idx in range(n_heads):
-                with model.trace(patching_request.destination):
-                    hidden_BLD = component.input
-                    hidden_BLHDh = einops.rearrange(
-                        hidden_BLD,
-                        "b l (n_heads d_head) -> b l n_heads d_head",
-                        n_heads=n_heads,
-                    )
-
-                    hidden_BLHDh[:, :, head_idx, :] = source_cache[
-                        (component, head_idx)
-                    ]
-
-                    hidden_BLD = einops.rearrange(
-                        hidden_BLHDh,
-                        "b l n_heads d_head -> b l (n_heads d_head)",
-                    )
-
-                    component.input = hidden_BLD
+    cells = [
+        (layer_idx, head_idx)
+        for layer_idx in range(len(components))
+        for head_idx in range(n_heads)
+    ]
+    chunks = [
+        (chunk[0][0], len(chunk), group_patches(chunk))
+        for chunk in (
+            cells[start:start + max_batch] for start in range(0, len(cells), max_batch)
+        )
+    ]
 
-                    if patching_request.incorrect_id is not None:
-                        patched_diff = logit_difference(model, patching_request)
-                        ioi_metric = compute_ioi_metric(
-                            source_diff, destination_diff, patched_diff
+    source = patching_request.source
+    destination = patching_request.destination
+    correct_id = patching_request.correct_id
+    incorrect_id = patching_request.incorrect_id
+
+    source_key = f"source:{patching_request.submodule}"
+
+    if job is not None:
+        job.total = len(cells)
+
+    with t.no_grad():
+        with model.session(remote=remote, backend=backend):
+            source_heads, clean_outputs, source_diff, destination_diff = clean_baselines(
+                model,
+                components,
+                source,
+                destination,
+                correct_id,
+                incorrect_id,
+                source_key=source_key,
+                n_heads=n_heads,
+                baseline=baseline,
+            )
+
+            metrics = []
+            for first_layer, n_rows, patches_by_layer in chunks:
+                with model.trace([destination] * n_rows):
+                    skip_clean_layers(model, clean_outputs, first_layer, n_rows)
+
+                    for layer_idx, (rows_N, heads_N) in patches_by_layer.items():
+                        component = components[layer_idx]
+                        hidden_BLHDh = component.input.unflatten(-1, (n_heads, -1))
+
+                        # [N, L, Dh]: each row's head across all positions.
+                        hidden_BLHDh[rows_N, :, heads_N] = (
+                            source_heads[layer_idx][:, heads_N]
+                            .transpose(0, 1)
+                            .to(hidden_BLHDh.device)
                         )
-                        results[(layer_idx, head_idx)] = ioi_metric
-                    else:
-                        prob = get_prob(model, patching_request)
-                        results[(layer_idx, head_idx)] = prob
 
-    results_grid = []
-    for layer_idx in range(len(components)):
-        results_grid.append([])
-        for head_idx in range(n_heads):
-            results_grid[layer_idx].append(results[(layer_idx, head_idx)])
-
-    return PatchResponse(
-        results=results_grid,
-        rowLabels=[layer for layer in range(len(components))],
-        colLabels=[head for head in range(n_heads)],
-    )
+                        component.input = hidden_BLHDh.flatten(-2)
 
+                    metrics.append(
+                        batched_metric(model, correct_id, incorrect_id, source_diff, destination_diff)
+                    )
 
-def patch_tokens(model: StandardizedTransformer, patching_request: PatchRequest):
+                # Local runs only: the job lives in this process.
+                if job is not None:
+                    job.advance(metrics[-1])
+
+            results = t.cat([m.float().cpu() for m in metrics]).save()
+
+    if remote:
+        return backend.job_id
+
+    return results
+
+
+def patch_positions(
+    model: StandardizedTransformer,
+    patching_request: PatchRequest,
+    cells: List[tuple[int, int, int]],
+    max_batch: int = PATCH_MAX_BATCH,
+    *,
+    remote: bool = False,
+    backend=None,
+    job: LocalJob | None = None,
+    baseline: dict | None = None,
+):
+    """Patch single source positions into the destination, one patch per cell.
+
+    Each ``(layer_idx, destination_idx, source_idx)`` cell copies the source
+    residual at ``source_idx`` into the destination at ``destination_idx``
+    on that layer's component. Cells run ``max_batch`` at a time as rows of
+    a batched destination pass; lower ``max_batch`` to bound memory on
+    CPU-only runs. Each pass resumes from its lowest patched layer
+    (``skip_clean_layers``).
+
+    Args:
+        model: Loaded wrapper.
+        patching_request: Source / destination prompts, submodule and metric.
+        cells: Patches, sorted by layer.
+        max_batch: Destination rows per forward pass.
+        remote: Run the sweep on NDIF.
+        backend: NDIF backend from ``AppState.make_backend``.
+        job: Local progress/cancellation record.
+        baseline: Local clean-baseline bundle (see ``run_patch_grid``); its
+            tensors are reused and whatever this sweep traces is added.
+
+    Returns:
+        The NDIF job ID when ``remote``; otherwise the ``[len(cells)]``
+        float32 metric per cell, gathered as one tensor.
+    """
     components = get_components(model, patching_request)
     is_tuple = patching_request.submodule == "blocks"
 
-    destination_prompt = patching_request.destination
-    destination_tokens = model.tokenizer.encode(destination_prompt)
-    n_tokens = len(destination_tokens)
-
-    source_cache = {}
-
-    with model.wrapped_session():
-        results = ns.dict().save()
-
-        with model.trace(patching_request.source):
-            for component in components:
-                hidden_BLD = component.output
-
-                if is_tuple:
-                    hidden_BLD = hidden_BLD[0]
+    chunks = [
+        (chunk[0][0], len(chunk), group_patches(chunk))
+        for chunk in (
+            cells[start:start + max_batch] for start in range(0, len(cells), max_batch)
+        )
+    ]
 
-                for token_idx in range(n_tokens):
-                    source_cache[(component, token_idx)] = hidden_BLD[
-                        :, token_idx, :
-                    ]
+    source = patching_request.source
+    destination = patching_request.destination
+    correct_id = patching_request.correct_id
+    incorrect_id = patching_request.incorrect_id
+
+    source_key = f"source:{patching_request.submodule}"
+
+    if job is not None:
+        job.total = len(cells)
+
+    with t.no_grad():
+        with model.session(remote=remote, backend=backend):
+            source_stack, clean_outputs, source_diff, destination_diff = clean_baselines(
+                model,
+                components,
+                source,
+                destination,
+                correct_id,
+                incorrect_id,
+                source_key=source_key,
+                is_tuple=is_tuple,
+                baseline=baseline,
+            )
+
+            metrics = []
+            for first_layer, n_rows, patches_by_layer in chunks:
+                with model.trace([destination] * n_rows):
+                    skip_clean_layers(model, clean_outputs, first_layer, n_rows)
+
+                    for layer_idx, (rows_N, destination_N, source_N) in patches_by_layer.items():
+                        component = components[layer_idx]
+
+                        if is_tuple:
+                            hidden_BLD_tuple = component.output
+                            hidden_BLD = hidden_BLD_tuple[0]
+                        else:
+                            hidden_BLD = component.output
+
+                        hidden_BLD[rows_N, destination_N] = source_stack[
+                            layer_idx, source_N
+                        ].to(hidden_BLD.device)
+
+                        if is_tuple:
+                            component.output = (hidden_BLD, hidden_BLD_tuple[1])
+                        else:
+                            component.output = hidden_BLD
+
+                    metrics.append(
+                        batched_metric(model, correct_id, incorrect_id, source_diff, destination_diff)
+                    )
 
-            if patching_request.incorrect_id is not None:
-                source_diff = logit_difference(model, patching_request)
+                # Local runs only: the job lives in this process.
+                if job is not None:
+                    job.advance(metrics[-1])
 
-        with model.trace(patching_request.destination):
-            destination_diff = logit_difference(model, patching_request)
+            results = t.cat([m.float().cpu() for m in metrics]).save()
 
-        for layer_idx, component in enumerate(components):
-            ns.log(f"Patching layer {layer_idx}")
-            for token_idx in range(n_tokens):
-                with model.trace(destination_prompt):
-                    if is_tuple:
-                        hidden_BLD_tuple = component.output
-                        hidden_BLD = hidden_BLD_tuple[0]
+    if remote:
+        return backend.job_id
 
-                        hidden_BLD[:, token_idx, :] = source_cache[
-                            (component, token_idx)
-                        ]
-                        component.output = (hidden_BLD, hidden_BLD_tuple[1])
+    return results
 
-                    else:
-                        hidden_BLD = component.output
 
-                        hidden_BLD[:, token_idx, :] = source_cache[
-                            (component, token_idx)
-                        ]
-                        component.output = hidden_BLD
+def patch_tokens(
+    model: StandardizedTransformer,
+    handle: ModelHandle,
+    patching_request: PatchRequest,
+    max_batch: int = PATCH_MAX_BATCH,
+    **run_kwargs,
+):
+    """Patch every (layer, destination position) from the same source position."""
+    n_tokens = len(handle.encode(patching_request.destination))
 
-                    if patching_request.incorrect_id is not None:
-                        patched_diff = logit_difference(model, patching_request)
-                        ioi_metric = compute_ioi_metric(
-                            source_diff, destination_diff, patched_diff
-                        )
-                        results[(layer_idx, token_idx)] = ioi_metric
-                    else:
-                        prob = get_prob(model, patching_request)
-                        results[(layer_idx, token_idx)] = prob.item()
-
-    results_grid = []
-    for layer_idx in range(len(components)):
-        results_grid.append([])
-        for token_idx in range(n_tokens):
-            results_grid[layer_idx].append(results[(layer_idx, token_idx)])
-
-    destination_token_ids = [
-        model.tokenizer.decode(token) for token in destination_tokens
+    cells = [
+        (layer_idx, token_idx, token_idx)
+        for layer_idx in range(model.num_layers)
+        for token_idx in range(n_tokens)
     ]
-
-    return PatchResponse(
-        results=results_grid,
-        rowLabels=[layer for layer in range(len(components))],
-        colLabels=destination_token_ids,
-    )
+    return patch_positions(model, patching_request, cells, max_batch, **run_kwargs)
 
 
 class PatchingIdxs(NamedTuple):
@@ -320,13 +457,13 @@ class PatchingIdxs(NamedTuple):
     tok_map: dict[int, int]
 
 def compute_patching_idxs(
-    tok: AutoTokenizer,
+    handle: ModelHandle,
     connections: List[Connection],
     source_prompt: str,
     destination_prompt: str,
 ) -> PatchingIdxs:
-    source_tokens = tok.encode(source_prompt)
-    destination_tokens = tok.encode(destination_prompt)
+    source_tokens = handle.encode(source_prompt)
+    destination_tokens = handle.encode(destination_prompt)
 
     start_idxs = chain(*[conn.start.token_indices for conn in connections])
     end_idxs = chain(*[conn.end.token_indices for conn in connections])
@@ -353,9 +490,10 @@ def compute_patching_idxs(
 
 
 def get_sync_x_labels(
-    connections: List[Connection], destination_prompt: str, tok: AutoTokenizer
+    connections: List[Connection], destination_prompt: str, handle: ModelHandle
 ) -> List[str]:
-    tokens = tok.encode(destination_prompt)
+    tokens = handle.encode(destination_prompt)
+    token_strs = handle.decode_tokens(destination_prompt)
 
     idx_to_connection = {}
     for connection in connections:
@@ -372,7 +510,7 @@ def get_sync_x_labels(
         if c is not None and c not in seen:
             start_idx = c.end.token_indices[0]
             end_idx = c.end.token_indices[-1] + 1
-            x_labels.append(tok.decode(tokens[start_idx:end_idx]))
+            x_labels.append(handle.tokenizer.decode(tokens[start_idx:end_idx]))
             x_items.append(c.end.token_indices[-1])
             seen.add(c)
 
@@ -380,151 +518,468 @@ def get_sync_x_labels(
             continue
 
         else:
-            x_labels.append(tok.decode(tokens[i]))
+            x_labels.append(token_strs[i])
             x_items.append(i)
 
     return x_labels, x_items
 
 
-def patch_tokens_sync(model: StandardizedTransformer, patching_request: PatchRequest):
-    components = get_components(model, patching_request)
-    is_tuple = patching_request.submodule == "blocks"
+def sync_position_pairs(
+    patching_idxs: PatchingIdxs, connections: List[Connection]
+) -> List[tuple[int, int]]:
+    """``(destination_idx, source_idx)`` pairs patched per layer in sync mode.
 
-    connections = [
-        edit for edit in patching_request.edits if isinstance(edit, Connection)
+    Unconnected tokens patch from their aligned source position; each
+    connection patches its start span's last token into its end span's.
+    """
+    pairs = [(d, patching_idxs.tok_map[d]) for d in patching_idxs.destination]
+    pairs += [
+        (connection.end.token_indices[-1], connection.start.token_indices[-1])
+        for connection in connections
     ]
+    return pairs
+
+
+def patch_tokens_sync(
+    model: StandardizedTransformer,
+    handle: ModelHandle,
+    patching_request: PatchRequest,
+    max_batch: int = PATCH_MAX_BATCH,
+    **run_kwargs,
+):
+    """Patch every (layer, column) of the sync grid; columns follow
+    ``get_sync_x_labels``, one per unconnected token or connection."""
+    connections = get_connections(patching_request)
+    destination_idxs, source_idxs = sync_columns(handle, patching_request, connections)
+
+    cells = [
+        (layer_idx, destination_idx, source_idx)
+        for layer_idx in range(model.num_layers)
+        for destination_idx, source_idx in zip(destination_idxs, source_idxs)
+    ]
+    return patch_positions(model, patching_request, cells, max_batch, **run_kwargs)
+
+
+def get_connections(patching_request: PatchRequest) -> List[Connection]:
+    return [edit for edit in patching_request.edits if isinstance(edit, Connection)]
 
+
+def sync_columns(
+    handle: ModelHandle,
+    patching_request: PatchRequest,
+    connections: List[Connection],
+) -> tuple[List[int], List[int]]:
+    """Destination and source position of each sync-grid column, in
+    ``get_sync_x_labels`` order."""
     patching_idxs = compute_patching_idxs(
-        model.tokenizer,
+        handle,
         connections,
         patching_request.source,
         patching_request.destination,
     )
+    pairs = dict(sync_position_pairs(patching_idxs, connections))
+    _, x_items = get_sync_x_labels(connections, patching_request.destination, handle)
+
+    return x_items, [pairs[x_item] for x_item in x_items]
+
+
+def attribution_patch(
+    model: StandardizedTransformer,
+    handle: ModelHandle,
+    patching_request: PatchRequest,
+    *,
+    remote: bool = False,
+    backend=None,
+    job: LocalJob | None = None,
+):
+    """First-order estimate of the patch grid (attribution patching).
+
+    One source pass caches the patched activations, and one destination
+    pass plus a backward pass (``torch.autograd.grad``, so no parameter
+    gets a ``.grad``) gives the gradient of the metric with respect to
+    them. Each cell's patched metric is estimated as the destination
+    metric plus ``(a_source - a_destination) · grad``, summed over the
+    patched slice: the whole sequence for ``blocks`` / ``attn`` / ``mlp``,
+    one position (pair) when patching tokens, or one head's ``o_proj``
+    input. The grid is reduced inside the session, so only
+    ``[n_layers, columns]`` floats come back.
+
+    Returns:
+        The NDIF job ID when ``remote``; otherwise the estimated grid.
+    """
+    n_layers = model.num_layers
+    heads = patching_request.submodule == "heads"
+    is_tuple = patching_request.submodule == "blocks"
+
+    if heads:
+        components = [model.attentions[i].o_proj for i in range(n_layers)]
+        n_heads = model.num_heads
+    else:
+        components = get_components(model, patching_request)
+        n_heads = None
+
+    source_idxs = destination_idxs = None
+    if patching_request.patch_tokens:
+        connections = get_connections(patching_request)
+        if connections:
+            destination_list, source_list = sync_columns(handle, patching_request, connections)
+            destination_idxs = t.tensor(destination_list)
+            source_idxs = t.tensor(source_list)
+        else:
+            destination_idxs = source_idxs = t.arange(
+                len(handle.encode(patching_request.destination))
+            )
+
+    source = patching_request.source
+    destination = patching_request.destination
+    correct_id = patching_request.correct_id
+    incorrect_id = patching_request.incorrect_id
+
+    if job is not None:
+        job.check_cancelled()
+
+    def _activation(component):
+        if heads:
+            return component.input
+
+        hidden_BLD = component.output
+        return hidden_BLD[0] if is_tuple else hidden_BLD
+
+    source_diff = None
+
+    with model.session(remote=remote, backend=backend):
+        with model.trace(source):
+            source_acts = [_activation(component).detach() for component in components]
+
+            if incorrect_id is not None:
+                source_diff = logit_difference(model, correct_id, incorrect_id).detach()
+
+        with model.trace(destination):
+            # Root the graph at the embeddings so the activations carry one
+            # even when the weights don't require grad. Parameter flags are
+            # shared with concurrent requests, so they are never touched.
+            model.embed_tokens.output.requires_grad_(True)
+
+            destination_acts = [_activation(component) for component in components]
+
+            if incorrect_id is not None:
+                metric = logit_difference(model, correct_id, incorrect_id)
+            else:
+                metric = get_prob(model, correct_id)
+
+            # Gradients w.r.t. the activations only: nothing accumulates in
+            # any parameter's ``.grad``, here or on NDIF.
+            grads = t.autograd.grad(metric, destination_acts)
+
+            # [n_layers, columns]
+            effect = t.stack(
+                [
+                    attribution_effect(
+                        source_acts[layer_idx][0],
+                        destination_acts[layer_idx][0].detach(),
+                        grads[layer_idx][0],
+                        source_idxs=source_idxs,
+                        destination_idxs=destination_idxs,
+                        n_heads=n_heads,
+                    )
+                    for layer_idx in range(n_layers)
+                ]
+            )
+
+            # Linearized patched metric: the IOI metric's numerator is the
+            # change in logit difference; the probability is the
+            # destination's plus its change.
+            baseline = metric.detach().float().cpu()
+            if incorrect_id is not None:
+                results = effect / ((source_diff.float().cpu() - baseline) + EPS)
+            else:
+                results = baseline + effect
+
+            results = results.save()
+
+    if job is not None:
+        # One backward pass yields every cell at once.
+        job.total = results.numel()
+        job.advance(results)
+
+    if remote:
+        return backend.job_id
+
+    return results
+
+
+def run_patch_grid(
+    model: StandardizedTransformer,
+    handle: ModelHandle,
+    patching_request: PatchRequest,
+    *,
+    remote: bool = False,
+    backend=None,
+    job: LocalJob | None = None,
+    baselines: TensorLRU | None = None,
+):
+    """Dispatch a patch-grid request to its sweep.
+
+    Args:
+        job: Local progress/cancellation record; ignored when ``remote``,
+            since NDIF tracks its own jobs.
+        baselines: Local cache of clean baselines keyed by ``(model, source,
+            destination)``. Each entry holds the clean last-position logits
+            of both prompts, the destination's per-layer block outputs and
+            the source activations per submodule, so a follow-up sweep on
+            the same prompt pair skips both clean passes. Ignored when
+            ``remote`` and by the attribution estimate, which needs its
+            destination pass for the gradients.
+
+    Returns:
+        The NDIF job ID when ``remote``; otherwise the grid as a flat or
+        ``[n_layers, columns]`` tensor for ``format_patch_grid``.
+    """
+    run_kwargs = {
+        "remote": remote,
+        "backend": backend,
+        "job": None if remote else job,
+    }
+
+    if patching_request.approximate:
+        return attribution_patch(model, handle, patching_request, **run_kwargs)
+
+    baseline = None
+    if baselines is not None and not remote:
+        key = (patching_request.model, patching_request.source, patching_request.destination)
+        baseline = baselines.get(key)
+        if baseline is None:
+            baseline = {}
+        run_kwargs["baseline"] = baseline
+
+    if patching_request.patch_tokens:
+        if get_connections(patching_request):
+            results = patch_tokens_sync(model, handle, patching_request, **run_kwargs)
+        else:
+            results = patch_tokens(model, handle, patching_request, **run_kwargs)
+    elif patching_request.submodule == "heads":
+        results = patch_heads(model, patching_request, **run_kwargs)
+    else:
+        results = patch_components(model, patching_request, **run_kwargs)
 
-    source_cache = {}
+    if baseline is not None:
+        # Re-put so the cache recounts the entry's bytes after the sweep
+        # added to it.
+        baselines.put(key, baseline)
 
-    with model.wrapped_session():
-        results = ns.dict().save()
+    return results
 
-        with model.trace(patching_request.source):
-            for component in components:
-                hidden_BLD = component.output
 
-                if is_tuple:
-                    hidden_BLD = hidden_BLD[0]
+def format_patch_grid(
+    results: t.Tensor,
+    patching_request: PatchRequest,
+    handle: ModelHandle,
+) -> PatchResponse:
+    """Build the ``PatchResponse`` for a sweep's results; needs no model."""
+    n_layers = handle.num_layers
+    grid = results.reshape(n_layers, -1).tolist()
 
-                for connection in connections:
-                    start_token_last_idx = connection.start.token_indices[-1]
+    if patching_request.patch_tokens:
+        connections = get_connections(patching_request)
+        if connections:
+            col_labels, _ = get_sync_x_labels(
+                connections, patching_request.destination, handle
+            )
+        else:
+            col_labels = handle.decode_tokens(patching_request.destination)
 
-                    source_cache[(component, connection)] = hidden_BLD[
-                        :, start_token_last_idx, :
-                    ]
+        row_labels = [layer for layer in range(n_layers)]
+    elif patching_request.submodule == "heads":
+        row_labels = [layer for layer in range(n_layers)]
+        col_labels = [head for head in range(len(grid[0]))]
+    else:
+        row_labels = col_labels = []
 
-                for token_idx in patching_idxs.source:
-                    source_cache[(component, token_idx)] = hidden_BLD[
-                        :, token_idx, :
-                    ]
+    return PatchResponse(
+        results=grid,
+        rowLabels=row_labels,
+        colLabels=col_labels,
+        approximate=patching_request.approximate,
+    )
 
-            if patching_request.incorrect_id is not None:
-                source_diff = logit_difference(model, patching_request)
 
-        with model.trace(patching_request.destination):
-            destination_diff = logit_difference(model, patching_request)
+def run_patch_job(
+    registry: JobRegistry,
+    job: LocalJob,
+    model: StandardizedTransformer,
+    handle: ModelHandle,
+    patching_request: PatchRequest,
+    baselines: TensorLRU | None = None,
+):
+    """Run a local sweep under ``job`` and retire it with its final status."""
+    try:
+        results = run_patch_grid(
+            model, handle, patching_request, job=job, baselines=baselines
+        )
+    except Exception:
+        registry.finish(job, "CANCELLED" if job.cancelled else "ERROR")
+        raise
+
+    registry.finish(job, "COMPLETED")
+    return results
+
+
+async def run_local_patch_grid(
+    state: AppState,
+    request: Request,
+    model: StandardizedTransformer,
+    handle: ModelHandle,
+    patching_request: PatchRequest,
+    user_email: str | None,
+) -> t.Tensor:
+    """Run a local sweep as a registered job of ``user_email``, off the event loop.
+
+    The sweep stops at its next forward pass when the job is cancelled via
+    ``/patch/jobs/{job_id}/cancel`` or when the client disconnects.
+
+    Raises:
+        HTTPException: 409 if the job ID is already running or the run was
+            cancelled.
+    """
+    try:
+        job = state.patch_jobs.create(patching_request.job_id, owner=user_email)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    run = asyncio.ensure_future(
+        asyncio.to_thread(
+            run_patch_job,
+            state.patch_jobs,
+            job,
+            model,
+            handle,
+            patching_request,
+            state.patch_baselines,
+        )
+    )
 
-        for layer_idx, component in enumerate(components):
-            for token_idx in patching_idxs.destination:
-                with model.trace(patching_request.destination):
-                    if is_tuple:
-                        hidden_BLD_tuple = component.output
-                        hidden_BLD = hidden_BLD_tuple[0]
-                    else:
-                        hidden_BLD = component.output
+    try:
+        while not run.done():
+            await asyncio.wait({run}, timeout=DISCONNECT_POLL_SECONDS)
+            if not run.done() and await request.is_disconnected():
+                job.cancel()
+    except asyncio.CancelledError:
+        job.cancel()
+        raise
+
+    try:
+        return run.result()
+    except Exception as e:
+        if job.cancelled:
+            raise HTTPException(
+                status_code=409, detail=f"Patch job {job.id} was cancelled"
+            )
+        raise e
 
-                    hidden_BLD[:, token_idx, :] = source_cache[
-                        (component, patching_idxs.tok_map[token_idx])
-                    ]
 
-                    if is_tuple:
-                        component.output = (hidden_BLD, hidden_BLD_tuple[1])
-                    else:
-                        component.output = hidden_BLD
+router = APIRouter()
 
-                    if patching_request.incorrect_id is not None:
-                        patched_diff = logit_difference(model, patching_request)
-                        ioi_metric = compute_ioi_metric(
-                            source_diff, destination_diff, patched_diff
-                        )
-                        results[(layer_idx, token_idx)] = ioi_metric
-                    else:
-                        prob = get_prob(model, patching_request)
-                        results[(layer_idx, token_idx)] = prob
-
-            for connection in connections:
-                with model.trace(patching_request.destination):
-                    if is_tuple:
-                        hidden_BLD_tuple = component.output
-                        hidden_BLD = hidden_BLD_tuple[0]
-                    else:
-                        hidden_BLD = component.output
-
-                    end_token_last_idx = connection.end.token_indices[-1]
-
-                    hidden_BLD[:, end_token_last_idx, :] = source_cache[
-                        (component, connection)
-                    ]
-
-                    if is_tuple:
-                        component.output = (hidden_BLD, hidden_BLD_tuple[1])
-                    else:
-                        component.output = hidden_BLD
-
-                    if patching_request.incorrect_id is not None:
-                        patched_diff = logit_difference(model, patching_request)
-                        ioi_metric = compute_ioi_metric(
-                            source_diff, destination_diff, patched_diff
-                        )
-                        results[(layer_idx, end_token_last_idx)] = ioi_metric
-                    else:
-                        prob = get_prob(model, patching_request)
-                        results[(layer_idx, end_token_last_idx)] = prob
 
-    x_labels, x_items = get_sync_x_labels(
-        connections, patching_request.destination, model.tokenizer
+@router.post("/start-grid", response_model=PatchGridResponse)
+async def start_patch_grid(
+    patching_request: PatchRequest,
+    request: Request,
+    state: AppState = Depends(get_state),
+    user_email: str = Depends(require_user_email),
+):
+    if state.remote:
+        if not user_has_model_access(user_email, patching_request.model, state):
+            message = f"User does not have access to {patching_request.model}"
+            raise HTTPException(status_code=403, detail=message)
+
+    model = await state.aget_model(patching_request.model)
+    handle = await state.aget_handle(patching_request.model)
+
+    if state.remote:
+        backend = state.make_backend(model=model)
+        job_id = await asyncio.to_thread(
+            run_patch_grid,
+            model,
+            handle,
+            patching_request,
+            remote=True,
+            backend=backend,
+        )
+        return {"job_id": job_id}
+
+    results = await run_local_patch_grid(
+        state, request, model, handle, patching_request, user_email
     )
+    return {"data": format_patch_grid(results, patching_request, handle)}
 
-    results_grid = []
-    for layer_idx in range(len(components)):
-        results_grid.append([])
-        for x_item in x_items:
-            results_grid[layer_idx].append(results[(layer_idx, x_item)])
 
-    return PatchResponse(
-        results=results_grid,
-        rowLabels=[layer for layer in range(len(components))],
-        colLabels=x_labels,
-    )
+@router.post("/results-grid/{job_id}", response_model=PatchGridResponse)
+async def collect_patch_grid(
+    job_id: str,
+    patching_request: PatchRequest,
+    state: AppState = Depends(get_state),
+    user_email: str = Depends(require_user_email),
+):
+    handle = await state.aget_handle(patching_request.model)
 
+    backend = state.make_backend(job_id=job_id)
+    results = backend()["results"]
 
-router = APIRouter()
+    return {"data": format_patch_grid(results, patching_request, handle)}
 
 
 @router.post("/patch-grid")
-async def patch(patching_request: PatchRequest, request: Request):
+async def patch(
+    patching_request: PatchRequest,
+    request: Request,
+    user_email: str | None = Depends(get_user_email),
+):
+    """Synchronous local patch grid; remote deployments use ``/start-grid``.
+
+    Without an ``X-User-Email`` header the run has no owner, so it can't be
+    polled or cancelled through ``/patch/jobs``.
+    """
     state = request.app.state.m
-    model = state.get_model(patching_request.model)
-
-    if patching_request.patch_tokens:
-        has_connections = any(
-            isinstance(edit, Connection) for edit in patching_request.edits
+    if state.remote:
+        raise HTTPException(
+            status_code=400,
+            detail="Use /patch/start-grid and /patch/results-grid in remote mode.",
         )
 
-        if has_connections:
-            return await asyncio.to_thread(patch_tokens_sync, model, patching_request)
-
-        return await asyncio.to_thread(patch_tokens, model, patching_request)
+    model = await state.aget_model(patching_request.model)
+    handle = await state.aget_handle(patching_request.model)
 
-    else:
-        if patching_request.submodule == "heads":
-            return await asyncio.to_thread(patch_heads, model, patching_request)
-
-        return await asyncio.to_thread(patch_components, model, patching_request)
+    results = await run_local_patch_grid(
+        state, request, model, handle, patching_request, user_email
+    )
+    return format_patch_grid(results, patching_request, handle)
+
+
+@router.get("/jobs/{job_id}")
+async def get_patch_job(
+    job_id: str,
+    state: AppState = Depends(get_state),
+    user_email: str = Depends(require_user_email),
+):
+    """Status, progress (``done`` / ``total`` cells) and partial results of a
+    local patch run."""
+    job = state.patch_jobs.get(job_id, owner=user_email)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown patch job: {job_id}")
+
+    return job.snapshot()
+
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_patch_job(
+    job_id: str,
+    state: AppState = Depends(get_state),
+    user_email: str = Depends(require_user_email),
+):
+    """Stop a local patch run at its next forward pass."""
+    job = state.patch_jobs.get(job_id, owner=user_email)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown patch job: {job_id}")
+
+    job.cancel()
+    return job.snapshot()
@@ -1,15 +1,27 @@
+import asyncio
+import hashlib
+import json
 import logging
 import os
+import tempfile
+import threading
+from contextlib import nullcontext
+import numpy as np
 import torch
 import toml
 from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from fastapi import Request
+from huggingface_hub import list_repo_files, snapshot_download
 
 from nnsight import CONFIG
 from nnterp import StandardizedTransformer
 from nnsight.intervention.backends.remote import RemoteBackend
+from transformers import AutoTokenizer, PreTrainedTokenizerBase
 
 from .data_models import ModelHeat
+from .jobs import JobRegistry
+from .result_cache import PendingResults, ResultCache
 
 from .metadata import (
     MetadataCache,
@@ -20,6 +32,335 @@ from .telemetry import TelemetryClient
 
 logger = logging.getLogger(__name__)
 
+# Weight dtype for every wrapper this process loads.
+MODEL_DTYPE = torch.bfloat16
+
+# Memory budget for the non-pinned working set, in GiB. Pinned models are
+# permanent and do not count against it. Models count at their weights' size
+# in both modes; remotely that is what NDIF holds for them, not what this
+# process does. Override via MODEL_MEMORY_BUDGET_GB.
+MODEL_MEMORY_BUDGET_GB = float(os.environ.get("MODEL_MEMORY_BUDGET_GB", "80"))
+
+# Flat per-wrapper cost on top of weights: tokenizer, module tree, config.
+WRAPPER_OVERHEAD_BYTES = 64 * 2**20
+
+# Local loads placing weights on devices at once. device_map="auto" sizes
+# each placement from the memory free at that moment, so concurrent loads
+# all see the same free memory and over-commit. Weight downloads run before
+# placement and are not limited by this. Override via
+# MODEL_LOAD_CONCURRENCY.
+MODEL_LOAD_CONCURRENCY = int(os.environ.get("MODEL_LOAD_CONCURRENCY", "1"))
+
+# Repo files a local load never reads: other frameworks' weights. PyTorch
+# pickles are skipped as well when the repo ships safetensors.
+UNUSED_WEIGHT_FILES = [
+    "*.msgpack", "*.h5", "*.ot", "*.onnx", "*.onnx_data", "onnx/*",
+    "*.tflite", "*.mlmodel", "coreml/*", "*.gguf",
+]
+
+# Threads running model loads. They have their own pool so slow loads never
+# starve request work on the default executor (``asyncio.to_thread``).
+# Override via MODEL_LOADER_THREADS.
+MODEL_LOADER_THREADS = int(os.environ.get("MODEL_LOADER_THREADS", "16"))
+
+# Budget for cached clean patching baselines (activations stay on the model's
+# device), in GiB. Override via PATCH_BASELINE_CACHE_GB.
+PATCH_BASELINE_CACHE_GB = float(os.environ.get("PATCH_BASELINE_CACHE_GB", "2"))
+
+# Finished lens results: in-memory budget in MiB, spill directory (empty to
+# disable spilling) and its budget in GiB. Override via RESULT_CACHE_MB,
+# RESULT_CACHE_DIR and RESULT_CACHE_DISK_GB.
+RESULT_CACHE_MB = float(os.environ.get("RESULT_CACHE_MB", "256"))
+RESULT_CACHE_DIR = os.environ.get(
+    "RESULT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "workbench-results")
+)
+RESULT_CACHE_DISK_GB = float(os.environ.get("RESULT_CACHE_DISK_GB", "2"))
+
+
+class ModelHandle:
+    """Tokenizer-level view of a model, without the nnsight wrapper.
+
+    Everything that only encodes prompts, decodes ids, or needs the layer
+    count (``/results-*`` handlers and ``process_*`` formatters) goes through
+    a handle instead of ``AppState.get_model``. In remote mode that avoids
+    building a full ``StandardizedTransformer`` just to tokenize.
+
+    The handle also owns the model's tokenization cache: routes call
+    ``encode`` / ``decode_tokens`` rather than the tokenizer directly so a
+    prompt is tokenized once across ``/start-*``, ``/results-*`` and
+    repolls.
+
+    Class attributes:
+        max_cached_prompts: Prompts kept per model in the tokenization LRU.
+
+    Attributes:
+        name: HuggingFace repo ID.
+        tokenizer: The model's tokenizer.
+        num_layers: Transformer block count.
+        cache_hits: Tokenization cache hits since the handle was created.
+        cache_misses: Tokenization cache misses since the handle was created.
+        _vocab_table: Object array mapping token id to its decoded string,
+            built on first ``decode_ids`` call.
+        _vocab_payload: ``(table size, JSON body, ETag)`` served by the
+            vocabulary endpoint, rebuilt when the table grows.
+    """
+
+    max_cached_prompts: int = 256
+
+    def __init__(
+        self,
+        name: str,
+        tokenizer: PreTrainedTokenizerBase,
+        num_layers: int,
+    ):
+        self.name = name
+        self.tokenizer = tokenizer
+        self.num_layers = num_layers
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._token_cache: OrderedDict[str, tuple[list[int], list[str]]] = OrderedDict()
+        self._token_lock = threading.Lock()
+        self._vocab_table: np.ndarray | None = None
+        self._vocab_lock = threading.Lock()
+        self._vocab_payload: tuple[int, bytes, str] | None = None
+
+    def decode_ids(self, ids) -> np.ndarray:
+        """Decode every token id in ``ids`` individually via the vocab table.
+
+        Equivalent to ``tokenizer.decode(i)`` for each element, as one gather
+        instead of a tokenizer call per id.
+
+        Args:
+            ids: Int ids of any shape — an int, nested lists, an ndarray, or a
+                tensor (on any device).
+
+        Returns:
+            Object array of ``str`` with the same shape as ``ids``; call
+            ``.tolist()`` for nested Python lists.
+        """
+        if isinstance(ids, torch.Tensor):
+            ids = ids.detach().cpu().numpy()
+        ids = np.asarray(ids, dtype=np.int64)
+        max_id = int(ids.max()) if ids.size else -1
+        return self._get_vocab_table(max_id + 1)[ids]
+
+    @property
+    def vocab_ready(self) -> bool:
+        """Whether the vocab table has been built (see ``warm_vocab``)."""
+        return self._vocab_table is not None
+
+    def warm_vocab(self) -> None:
+        """Build the vocab table now, so no later ``decode_ids`` pays for it.
+
+        Decodes the whole vocabulary (seconds for a 128k vocab); call from a
+        worker thread, never the event loop. ``AppState.aget_handle`` and
+        model loads do.
+        """
+        self._get_vocab_table()
+
+    def label_ids(self, ids, as_ids: bool = False) -> np.ndarray:
+        """Labels for token ``ids``: decoded strings, or the ids themselves.
+
+        With ``as_ids`` each label is the id as a decimal string, for
+        clients that resolve labels through the vocabulary endpoint instead
+        (see ``vocab_payload``); no decoding happens.
+
+        Returns:
+            Object array of ``str`` with the same shape as ``ids``.
+        """
+        if not as_ids:
+            return self.decode_ids(ids)
+
+        if isinstance(ids, torch.Tensor):
+            ids = ids.detach().cpu().numpy()
+        return np.asarray(ids, dtype=np.int64).astype(str).astype(object)
+
+    def prompt_labels(self, prompt: str, as_ids: bool = False) -> list[str]:
+        """``decode_tokens(prompt)``, or with ``as_ids`` its token ids as
+        decimal strings (see ``label_ids``)."""
+        if not as_ids:
+            return self.decode_tokens(prompt)
+        return self.label_ids(self.encode(prompt), as_ids=True).tolist()
+
+    def vocab_payload(self) -> tuple[bytes, str]:
+        """The full id -> string table as a JSON list, and its ETag.
+
+        Built once per table size, so repeated fetches (and 304 checks) cost
+        a tuple lookup.
+
+        Returns:
+            ``(body, etag)``, where ``body`` is ``{"model", "tokens"}`` with
+            ``tokens[i]`` the label of id ``i``.
+        """
+        table = self._get_vocab_table()
+        payload = self._vocab_payload
+        if payload is not None and payload[0] == len(table):
+            return payload[1:]
+
+        body = json.dumps(
+            {"model": self.name, "tokens": table.tolist()},
+            ensure_ascii=False,
+            separators=(",", ":"),
+        ).encode()
+        etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        self._vocab_payload = (len(table), body, etag)
+        return body, etag
+
+    def _get_vocab_table(self, min_size: int = 0) -> np.ndarray:
+        """Return the id -> string table, building or extending it as needed.
+
+        Sized to the tokenizer's vocabulary on first use. Logits can be wider
+        than the tokenizer (padded embedding matrices), so the table grows to
+        cover ``min_size`` ids when asked.
+        """
+        table = self._vocab_table
+        if table is not None and len(table) >= min_size:
+            return table
+
+        with self._vocab_lock:
+            table = self._vocab_table
+            start = 0 if table is None else len(table)
+            size = max(min_size, len(self.tokenizer), start)
+            if table is None or size > start:
+                decoded = np.empty(size - start, dtype=object)
+                decoded[:] = self.tokenizer.batch_decode(
+                    [[token] for token in range(start, size)]
+                )
+                table = decoded if table is None else np.concatenate([table, decoded])
+                self._vocab_table = table
+            return table
+
+    def encode(self, prompt: str) -> list[int]:
+        """Token ids for ``prompt`` (as ``tokenizer.encode``; BOS-inclusive).
+
+        The returned list is shared with the cache; do not mutate it.
+        """
+        return self._tokenize(prompt)[0]
+
+    def decode_tokens(self, prompt: str) -> list[str]:
+        """Per-token decoded strings for ``prompt``, aligned with ``encode``.
+
+        The returned list is shared with the cache; do not mutate it.
+        """
+        return self._tokenize(prompt)[1]
+
+    def _tokenize(self, prompt: str) -> tuple[list[int], list[str]]:
+        """Return cached ``(ids, strings)`` for ``prompt``, tokenizing on a miss."""
+        with self._token_lock:
+            entry = self._token_cache.get(prompt)
+            if entry is not None:
+                self._token_cache.move_to_end(prompt)
+                self.cache_hits += 1
+                return entry
+
+        ids = self.tokenizer.encode(prompt)
+        entry = (ids, [str(self.tokenizer.decode(token)) for token in ids])
+
+        with self._token_lock:
+            self.cache_misses += 1
+            self._token_cache[prompt] = entry
+            while len(self._token_cache) > self.max_cached_prompts:
+                self._token_cache.popitem(last=False)
+        return entry
+
+    def cache_stats(self) -> dict:
+        """Tokenization cache size and hit/miss counters."""
+        with self._token_lock:
+            return {
+                "cached_prompts": len(self._token_cache),
+                "hits": self.cache_hits,
+                "misses": self.cache_misses,
+            }
+
+    @classmethod
+    def from_model(cls, name: str, model: StandardizedTransformer) -> "ModelHandle":
+        """Build a handle that shares an already-loaded wrapper's tokenizer."""
+        return cls(name, model.tokenizer, model.num_layers)
+
+
+class TensorLRU:
+    """Byte-budgeted LRU of tensor bundles.
+
+    Values are dicts (or tuples / lists) whose leaves are tensors or plain
+    Python values; an entry costs the bytes of its tensors. The least
+    recently used entries are evicted once the total exceeds ``max_bytes``,
+    and an entry larger than the whole budget is not kept at all.
+
+    Attributes:
+        max_bytes: Budget for all entries together.
+        hits: Lookups that found an entry.
+        misses: Lookups that did not.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._sizes: dict = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the entry for ``key`` (marking it recently used), or ``None``."""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value) -> None:
+        """Insert or re-size ``key``'s entry, then evict down to the budget.
+
+        Call again after growing an entry in place so its size is recounted.
+        """
+        size = self._nbytes(value)
+
+        with self._lock:
+            self._bytes -= self._sizes.pop(key, 0)
+            self._entries.pop(key, None)
+            if size > self.max_bytes:
+                return
+
+            self._entries[key] = value
+            self._sizes[key] = size
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest, _ = self._entries.popitem(last=False)
+                self._bytes -= self._sizes.pop(oldest)
+
+    def discard(self, predicate) -> None:
+        """Drop every entry whose key satisfies ``predicate``."""
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+                self._bytes -= self._sizes.pop(key)
+
+    def stats(self) -> dict:
+        """Entry count, bytes held against the budget and hit/miss counters."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "budget_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    @classmethod
+    def _nbytes(cls, value) -> int:
+        if isinstance(value, torch.Tensor):
+            return value.numel() * value.element_size()
+        if isinstance(value, dict):
+            return sum(cls._nbytes(v) for v in value.values())
+        if isinstance(value, (tuple, list)):
+            return sum(cls._nbytes(v) for v in value)
+        return 0
+
 
 class AppState:
     """Central runtime state for model loading, catalog tracking, and metadata.
@@ -34,37 +375,86 @@ class AppState:
        created lazily and LRU-evicted for non-pinned models.
 
     Class attributes:
-        max_non_pinned_models: Maximum concurrently loaded non-pinned models.
-            Pinned models are exempt from this cap and from eviction.
+        max_non_pinned_bytes: Memory budget for loaded non-pinned models.
+            Pinned models are exempt from this budget and from eviction.
 
     Instance attributes:
         remote: Whether inference runs against NDIF rather than locally.
+        patch_jobs: Local patch sweeps in flight (and recently finished), for
+            progress polls and cancellation.
+        patch_baselines: Clean source / destination baselines for local patch
+            sweeps, keyed by ``(model, source, destination)``.
+        results: Finished lens, logit-lens and j-lens results keyed by a hash
+            of the request, served without a trace or NDIF job.
+        pending_results: ``results`` key of each NDIF job still to be
+            collected, recorded when the job is submitted.
         models: Loaded ``StandardizedTransformer`` wrappers keyed by repo ID.
         catalog: NDIF deployment roster mapping repo ID to ``ModelHeat``. This
             drives the frontend model list; whether a model is actually loaded
             here is a separate concern.
         pinned: Repo IDs that must never be LRU-evicted. Populated from TOML in
             local mode, or from NDIF pin status in remote mode.
+        preload: Pinned repo IDs loaded in the background by
+            ``preload_pinned`` (local mode only; empty in remote mode).
         _metadata: Disk-backed metadata cache; owns HuggingFace fetch/persist.
         _active_models: Loaded non-pinned models in recency order (LRU) — the
             working set subject to eviction. Pinned models are permanent and
             never tracked here.
+        _loading: In-flight loads keyed by repo ID. Concurrent requests for
+            the same unloaded model wait on the one future instead of each
+            constructing a wrapper.
+        _handles: Cached ``ModelHandle`` per repo ID. Kept separately from
+            ``models`` and never LRU-evicted — a tokenizer costs a few MB
+            against gigabytes for a wrapper.
+        _preload_errors: Failure message per pinned repo ID whose background
+            preload raised.
+        _model_bytes: Resident cost per repo ID. Holds the pre-load estimate
+            while a load is in flight and the measured size once loaded.
+        _lock: Guards ``models``, ``_active_models``, ``_loading`` and
+            ``_model_bytes``, which are touched from both the event loop and
+            loader threads.
+        _placement_slots: Bounds local loads that place weights on devices
+            concurrently (``MODEL_LOAD_CONCURRENCY``).
+        _load_executor: Threads that run ``aget_model``'s loads, apart from
+            the default executor (``MODEL_LOADER_THREADS``).
         ndif_backend_url: Base URL for NDIF API calls (set during init).
         telemetry_url: InfluxDB endpoint for request telemetry (set during init).
     """
 
-    max_non_pinned_models: int = 5
+    max_non_pinned_bytes: int = int(MODEL_MEMORY_BUDGET_GB * 2**30)
 
     def __init__(self):
-        """Initialize backend config, load TOML, and preload pinned models locally."""
+        """Initialize backend config and read the pinned list from TOML.
+
+        No weights are loaded here; local-mode pinned models are loaded by
+        ``preload_pinned`` once the server is up.
+        """
 
         self.models: dict[str, StandardizedTransformer] = {}
         self._metadata = MetadataCache()
         self.catalog: dict[str, ModelHeat] = {}
+        self._active_models: OrderedDict[str, None] = OrderedDict()
+        self._loading: dict[str, Future] = {}
+        self._model_bytes: dict[str, int] = {}
+        self._handles: dict[str, ModelHandle] = {}
+        self._lock = threading.RLock()
+        self._placement_slots = threading.BoundedSemaphore(MODEL_LOAD_CONCURRENCY)
+        self._load_executor = ThreadPoolExecutor(
+            max_workers=MODEL_LOADER_THREADS, thread_name_prefix="model-load"
+        )
+        self.patch_jobs = JobRegistry()
+        self.patch_baselines = TensorLRU(int(PATCH_BASELINE_CACHE_GB * 2**30))
+        self.results = ResultCache(
+            int(RESULT_CACHE_MB * 2**20),
+            directory=RESULT_CACHE_DIR or None,
+            max_disk_bytes=int(RESULT_CACHE_DISK_GB * 2**30),
+        )
+        self.pending_results = PendingResults()
 
         self.remote = self._load_backend_config()
-        self.pinned = set(self._load_pinned_config()) if not self.remote else set()
-        self._active_models: OrderedDict[str, None] = OrderedDict()
+        self.preload: list[str] = self._load_pinned_config() if not self.remote else []
+        self.pinned = set(self.preload)
+        self._preload_errors: dict[str, str] = {}
 
         # TelemetryClient.init(self)
 
@@ -116,18 +506,28 @@ class AppState:
             self.pinned.add(model_name)
             # If it was previously in the LRU as non-pinned, take it out — it
             # no longer participates in eviction.
-            self._active_models.pop(model_name, None)
+            with self._lock:
+                self._active_models.pop(model_name, None)
         else:
             # Transitioned out of pinned (NDIF un-pinned it). Drop from pinned
             # set; future get_model calls will treat it as non-pinned and put
             # it in the LRU.
-            self.pinned.discard(model_name)
+            with self._lock:
+                was_pinned = model_name in self.pinned
+                self.pinned.discard(model_name)
+                # Already loaded: its bytes now count against the non-pinned
+                # budget, so it must also be evictable, or that budget is
+                # lost for good. A load still in flight joins the LRU itself
+                # when it finishes (``_run_load``).
+                if was_pinned and model_name in self.models:
+                    self._active_models[model_name] = None
+                    self._evict_if_needed(keep=model_name)
 
     def deregister_catalog_entry(self, model_name: str) -> None:
         """Remove a catalog entry for a model NDIF no longer serves.
 
-        Non-pinned wrappers are unloaded immediately. Pinned wrappers are kept
-        in memory in case the deployment flaps back online.
+        Non-pinned wrappers and handles are unloaded immediately. Pinned ones
+        are kept in memory in case the deployment flaps back online.
         """
         self.catalog.pop(model_name, None)
         was_pinned = model_name in self.pinned
@@ -135,6 +535,8 @@ class AppState:
         
         if not was_pinned:
             self._unload_model(model_name)
+            with self._lock:
+                self._handles.pop(model_name, None)
 
     def get_catalog(self) -> list[dict]:
         """Return the user-facing model list for remote mode.
@@ -164,9 +566,13 @@ class AppState:
         """Return a loaded model wrapper, loading on demand if needed.
 
         Non-pinned models are tracked in an LRU cache. Loading a new
-        non-pinned model may evict the least-recently-used one when the count
-        exceeds ``max_non_pinned_models``. Already-loaded non-pinned models
-        have their LRU position bumped on each access.
+        non-pinned model evicts least-recently-used ones until its estimated
+        size fits within ``max_non_pinned_bytes``. Already-loaded non-pinned
+        models have their LRU position bumped on each access.
+
+        Blocks the calling thread for the duration of a cold load. Async
+        handlers should use ``aget_model`` instead so the event loop keeps
+        serving other requests.
 
         Args:
             model_name: HuggingFace repo ID.
@@ -174,42 +580,307 @@ class AppState:
         Returns:
             The ``StandardizedTransformer`` wrapper for ``model_name``.
 
+        Raises:
+            KeyError: If ``model_name`` is not in the catalog or pinned set.
+        """
+        model = self._get_loaded(model_name)
+        if model is not None:
+            return model
+
+        future, owner = self._claim_load(model_name)
+        if owner:
+            self._run_load(model_name, future)
+        return future.result()
+
+    async def aget_model(self, model_name: str) -> StandardizedTransformer:
+        """Async ``get_model`` that never blocks the event loop.
+
+        Cold loads run on ``_load_executor``. Concurrent callers for the same
+        repo share one in-flight load; requests for other (or already-loaded)
+        models proceed meanwhile.
+
+        Raises:
+            KeyError: If ``model_name`` is not in the catalog or pinned set.
+        """
+        model = self._get_loaded(model_name)
+        if model is not None:
+            return model
+
+        future, owner = self._claim_load(model_name)
+        if owner:
+            asyncio.get_running_loop().run_in_executor(
+                self._load_executor, self._run_load, model_name, future
+            )
+        # Shield so a disconnecting client cancels only its own wait, not the
+        # shared load other requests are waiting on.
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    def get_handle(self, model_name: str) -> ModelHandle:
+        """Return the lightweight ``ModelHandle`` for ``model_name``.
+
+        Reuses a loaded wrapper's tokenizer when there is one; otherwise loads
+        only the tokenizer and takes the layer count from cached metadata.
+        Never triggers a wrapper load.
+
         Raises:
             KeyError: If ``model_name`` is not in the catalog or pinned set.
         """
         if model_name not in self.catalog and model_name not in self.pinned:
             raise KeyError(model_name)
 
-        if model_name not in self.models:
-            self._load_model(model_name)
+        with self._lock:
+            handle = self._handles.get(model_name)
+            model = self.models.get(model_name)
+        if handle is not None:
+            return handle
 
-            if model_name not in self.pinned:
-                self._active_models[model_name] = None
-                self._evict_if_needed()
-        
-        elif model_name not in self.pinned:
-            # Already loaded; bump recency.
-            self._active_models.move_to_end(model_name)
-        
-        return self.models[model_name]
+        if model is not None:
+            handle = ModelHandle.from_model(model_name, model)
+        else:
+            meta = self._metadata.fetch_metadata(model_name)
+            tokenizer = AutoTokenizer.from_pretrained(model_name)
+            handle = ModelHandle(model_name, tokenizer, meta.n_layers)
+
+        with self._lock:
+            return self._handles.setdefault(model_name, handle)
+
+    async def aget_handle(self, model_name: str) -> ModelHandle:
+        """Async ``get_handle``; a first-time tokenizer load and vocab table
+        build run in a worker thread.
+
+        Raises:
+            KeyError: If ``model_name`` is not in the catalog or pinned set.
+        """
+        handle = self._handles.get(model_name)
+        if handle is None or (model_name not in self.catalog and model_name not in self.pinned):
+            handle = await asyncio.to_thread(self.get_handle, model_name)
+
+        # Formatters decode synchronously on the event loop; make sure the
+        # first one doesn't build the vocab table there.
+        if not handle.vocab_ready:
+            await asyncio.to_thread(handle.warm_vocab)
+        return handle
+
+    def _get_loaded(self, model_name: str) -> StandardizedTransformer | None:
+        """Return the wrapper if already loaded (bumping LRU), else ``None``.
+
+        Raises:
+            KeyError: If ``model_name`` is not in the catalog or pinned set.
+        """
+        if model_name not in self.catalog and model_name not in self.pinned:
+            raise KeyError(model_name)
+
+        with self._lock:
+            model = self.models.get(model_name)
+            if model is not None and model_name in self._active_models:
+                self._active_models.move_to_end(model_name)
+            return model
 
-    def _evict_if_needed(self) -> None:
-        """Evict the oldest non-pinned models until within ``max_non_pinned_models``."""
-        while len(self._active_models) > self.max_non_pinned_models:
-            oldest, _ = self._active_models.popitem(last=False)
+    def _claim_load(self, model_name: str) -> tuple[Future, bool]:
+        """Return the in-flight load future for ``model_name``.
+
+        The second element is True when the caller created the future and is
+        therefore responsible for running ``_run_load``.
+        """
+        with self._lock:
+            future = self._loading.get(model_name)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._loading[model_name] = future
+            return future, True
+
+    def _run_load(self, model_name: str, future: Future) -> None:
+        """Load ``model_name``, register it, and resolve ``future``.
+
+        Exceptions are delivered through ``future`` so every waiter sees the
+        same failure; the next request after a failure retries the load.
+        """
+        try:
+            estimate = self._estimate_model_bytes(model_name)
+            with self._lock:
+                if model_name not in self.pinned:
+                    self._evict_if_needed(incoming=estimate)
+                self._model_bytes[model_name] = estimate
+
+            self._load_model(model_name)
+            model = self.models[model_name]
+            measured = self._measure_model_bytes(model)
+
+            with self._lock:
+                self._model_bytes[model_name] = measured
+                if model_name not in self.pinned:
+                    self._active_models[model_name] = None
+                    # The estimate can undershoot (e.g. "unknown" params);
+                    # settle up against the measured size.
+                    self._evict_if_needed(keep=model_name)
+        except BaseException as e:
+            with self._lock:
+                if model_name not in self.models:
+                    self._model_bytes.pop(model_name, None)
+            future.set_exception(e)
+        else:
+            # Still on the loader thread: routes format right after
+            # ``aget_model`` without going through ``aget_handle``. A failure
+            # here only defers the build to the first decode.
+            try:
+                self.get_handle(model_name).warm_vocab()
+            except Exception as e:
+                logger.warning(f"Failed to build vocab table for {model_name}: {e}")
+            future.set_result(model)
+        finally:
+            with self._lock:
+                self._loading.pop(model_name, None)
+
+    def _evict_if_needed(self, incoming: int = 0, keep: str | None = None) -> None:
+        """Evict the oldest non-pinned models until ``incoming`` more bytes fit.
+
+        Args:
+            incoming: Estimated size of a model about to be loaded.
+            keep: Repo ID that must survive (the model just loaded). If it
+                alone exceeds the budget it stays loaded by itself.
+        """
+        while self._non_pinned_bytes() + incoming > self.max_non_pinned_bytes:
+            oldest = next((name for name in self._active_models if name != keep), None)
+            if oldest is None:
+                logger.warning(
+                    f"Non-pinned models exceed memory budget "
+                    f"({self._non_pinned_bytes() + incoming} > {self.max_non_pinned_bytes} bytes) "
+                    f"with nothing left to evict"
+                )
+                return
             logger.info(f"LRU evicting non-pinned model: {oldest}")
             self._unload_model(oldest)
 
+    def _non_pinned_bytes(self) -> int:
+        """Bytes held (or reserved by in-flight loads) by non-pinned models."""
+        return sum(
+            size for name, size in self._model_bytes.items() if name not in self.pinned
+        )
+
+    def _estimate_model_bytes(self, model_name: str) -> int:
+        """Pre-load size estimate from cached parameter count and ``MODEL_DTYPE``.
+
+        Used in both modes, so remote models are budgeted by size too rather
+        than as a flat overhead each. Models whose parameter count is
+        unknown estimate at the overhead alone until measured.
+        """
+        meta = self._metadata.fetch_metadata(model_name)
+        return meta.num_params * MODEL_DTYPE.itemsize + WRAPPER_OVERHEAD_BYTES
+
+    @staticmethod
+    def _measure_model_bytes(model: StandardizedTransformer) -> int:
+        """Size of a loaded wrapper's parameters and buffers.
+
+        Meta tensors count at their nominal size: the result then doesn't
+        depend on whether the wrapper has been dispatched yet, and a remote
+        wrapper (whose weights never leave the meta device) measures at the
+        model's full size, matching ``_estimate_model_bytes``.
+        """
+        module = model._model
+        tensors = list(module.parameters()) + list(module.buffers())
+        return sum(
+            tensor.numel() * tensor.element_size() for tensor in tensors
+        ) + WRAPPER_OVERHEAD_BYTES
+
     def _unload_model(self, model_name: str) -> None:
         """Remove a model wrapper from memory.
 
         Metadata for ``model_name`` is retained in the cache.
         """
-        self.models.pop(model_name, None)
-        self._active_models.pop(model_name, None)
+        with self._lock:
+            self.models.pop(model_name, None)
+            self._active_models.pop(model_name, None)
+            self._model_bytes.pop(model_name, None)
+
+        # Cached activations would otherwise pin device memory of the
+        # unloaded model.
+        self.patch_baselines.discard(lambda key: key[0] == model_name)
+
+    # ----- pinned preload (local mode) -------------------------------------
+
+    async def preload_pinned(self) -> None:
+        """Load every pinned model in the background.
+
+        Meant to run as a task started after the server is up. Loads start
+        together (up to ``MODEL_LOADER_THREADS``) and download their weights
+        in parallel; only device placement is bounded by
+        ``MODEL_LOAD_CONCURRENCY`` (see ``_load_model``). Each load goes
+        through ``aget_model``: a request for a pinned model still loading
+        joins that load, and already-loaded models are served immediately.
+        A failed load is logged and reported by ``get_readiness``; it does
+        not stop the others.
+        """
+
+        async def _preload(model_name: str) -> None:
+            try:
+                await self.aget_model(model_name)
+            except Exception as e:
+                logger.exception(f"Failed to preload pinned model {model_name}")
+                self._preload_errors[model_name] = str(e)
+            else:
+                logger.info(f"Preloaded pinned model: {model_name}")
+
+        await asyncio.gather(*(_preload(name) for name in self.preload))
+
+    def get_readiness(self) -> dict:
+        """Report per-model progress of the pinned preload.
+
+        Returns:
+            ``{"ready", "models"}`` where ``ready`` is True once every pinned
+            model is loaded, and ``models`` maps each pinned repo ID to a
+            ``status`` of ``pending``, ``loading``, ``ready`` or ``failed``
+            (with an ``error`` message when failed).
+        """
+        models = {}
+        with self._lock:
+            for name in self.preload:
+                if name in self.models:
+                    models[name] = {"status": "ready"}
+                elif name in self._loading:
+                    models[name] = {"status": "loading"}
+                elif name in self._preload_errors:
+                    models[name] = {"status": "failed", "error": self._preload_errors[name]}
+                else:
+                    models[name] = {"status": "pending"}
+
+        return {
+            "ready": all(m["status"] == "ready" for m in models.values()),
+            "models": models,
+        }
 
     # ----- public accessors ------------------------------------------------
 
+    def get_memory_usage(self) -> dict:
+        """Report resident model memory against the non-pinned budget.
+
+        Returns:
+            ``{"budget_bytes", "non_pinned_bytes", "models", "handles",
+            "patch_baselines", "results"}`` where ``models`` maps each loaded
+            (or loading) repo ID to its size in bytes, whether it is pinned,
+            and whether its load is in flight, ``handles`` maps each cached
+            handle to its tokenization cache stats, and ``patch_baselines``
+            and ``results`` report the baseline and result caches.
+        """
+        with self._lock:
+            return {
+                "budget_bytes": self.max_non_pinned_bytes,
+                "non_pinned_bytes": self._non_pinned_bytes(),
+                "models": {
+                    name: {
+                        "bytes": size,
+                        "pinned": name in self.pinned,
+                        "loading": name in self._loading,
+                    }
+                    for name, size in self._model_bytes.items()
+                },
+                "handles": {
+                    name: handle.cache_stats() for name, handle in self._handles.items()
+                },
+                "patch_baselines": self.patch_baselines.stats(),
+                "results": self.results.stats(),
+            }
+
     def get_model_metadata(self, model_name: str) -> ModelMetadata:
         """Return cached metadata for ``model_name``.
 
@@ -247,7 +918,12 @@ class AppState:
             return None
 
     def __getitem__(self, model_name: str):
-        """Alias for ``get_model`` — enables ``state[model_name]`` in handlers."""
+        """Alias for ``get_model`` — enables ``state[model_name]`` in handlers.
+
+        Blocks on a cold load, like ``get_model``; async handlers should
+        use the wrapper ``aget_model`` returned instead, since the model can
+        be evicted in between.
+        """
         return self.get_model(model_name)
 
     # ----- bootstrap -------------------------------------------------------
@@ -279,11 +955,11 @@ class AppState:
         return remote
 
     def _load_pinned_config(self) -> list[str]:
-        """Load pinned repo IDs from TOML and preload them in local mode.
+        """Load pinned repo IDs from TOML.
 
         The TOML file is selected by the ``CONFIG`` env var (default ``dev``).
-        In local mode, pinned models are fetched and loaded onto GPU at startup.
-        In remote mode the pinned list is ignored — pin status comes from NDIF.
+        Only consulted in local mode; in remote mode pin status comes from
+        NDIF. Loading the listed models is left to ``preload_pinned``.
 
         Returns:
             Pinned repo IDs from the TOML file.
@@ -297,22 +973,13 @@ class AppState:
         with open(config_path, "r") as f:
             pinned: list[str] = toml.load(f).get("pinned", [])
 
-        if not self.remote:
-            for model_name in pinned:
-                self._metadata.fetch_metadata(model_name)
-                model = StandardizedTransformer(
-                    model_name,
-                    device_map="auto",
-                    torch_dtype=torch.bfloat16,
-                    remote=self.remote,
-                )
-                self.models[model_name] = model
         return pinned
 
     def _load_model(self, model_name: str):
         """Load a single model wrapper on demand.
 
-        Ensures metadata is cached, then constructs a ``StandardizedTransformer``.
+        Ensures metadata is cached, downloads the weights (local mode), then
+        constructs a ``StandardizedTransformer``.
         In remote mode the wrapper is used for tokenization and dispatch only;
         weights are not loaded locally.
         """
@@ -320,16 +987,46 @@ class AppState:
 
         self._metadata.fetch_metadata(model_name)
 
-        model = StandardizedTransformer(
-            model_name,
-            device_map="auto",
-            torch_dtype=torch.bfloat16,
-            remote=False,
-            allow_dispatch=not self.remote,
-            check_renaming=not self.remote,
-        )
+        # Downloads need no slot, so concurrent loads (``preload_pinned``)
+        # fetch their weights in parallel.
+        if not self.remote:
+            self._fetch_weights(model_name)
+
+        # Locally, build and dispatch (place the weights) while holding a
+        # placement slot, so each device map sees the memory left by the
+        # loads before it. Remote wrappers stay on the meta device.
+        with self._placement_slots if not self.remote else nullcontext():
+            model = StandardizedTransformer(
+                model_name,
+                device_map="auto",
+                torch_dtype=MODEL_DTYPE,
+                remote=False,
+                allow_dispatch=not self.remote,
+                check_renaming=not self.remote,
+            )
+            if not self.remote:
+                model.dispatch()
+
+        with self._lock:
+            self.models[model_name] = model
+
+    @staticmethod
+    def _fetch_weights(model_name: str) -> None:
+        """Download ``model_name``'s files into the HuggingFace cache.
+
+        Best effort: on failure (offline, a local path) the wrapper fetches
+        what it needs itself, inside its placement slot.
+        """
+        if os.path.isdir(model_name):
+            return
 
-        self.models[model_name] = model
+        try:
+            ignore = list(UNUSED_WEIGHT_FILES)
+            if any(name.endswith(".safetensors") for name in list_repo_files(model_name)):
+                ignore += ["*.bin", "*.pth", "*.pt"]
+            snapshot_download(model_name, ignore_patterns=ignore)
+        except Exception as e:
+            logger.warning(f"Failed to prefetch weights for {model_name}: {e}")
 
 
 def get_state(request: Request) -> AppState:
@@ -0,0 +1,211 @@
+"""Vocabulary projection and lens reductions that run inside traces.
+
+Everything here executes inside ``model.trace`` — locally or on NDIF — so
+the module depends on torch only and is registered with ``ndif.register``
+(see ``routes/__init__.py``) to be shipped to the server by value.
+
+Public API:
+
+    ``project_on_vocab``
+        Final norm + unembedding for many layers' residuals as one GEMM.
+
+    ``rank_of``
+        1-based rank of target ids by counting strictly larger logits;
+        ties share the lowest rank.
+
+    ``layer_lens_reductions``
+        Tiled projection over (layer, position) rows that keeps only the
+        requested reductions (top-k, target probability and rank, entropy,
+        probabilities of chosen ids). Peak memory is bounded by
+        ``LENS_TILE_ROWS`` rows of vocabulary logits rather than by
+        layers × prompt length.
+
+    ``union_ids_per_position``
+        Per-position union of top-k ids across layers, padded to a
+        rectangular ``[T, U]`` tensor for ``gather_ids``.
+"""
+
+import os
+
+import torch as t
+
+# (layer, position) rows projected onto the vocabulary per tile. A tile holds
+# a few [rows, V] buffers at once. Override via LENS_TILE_ROWS.
+LENS_TILE_ROWS = int(os.environ.get("LENS_TILE_ROWS", "256"))
+
+
+def project_on_vocab(model, hiddens: list[t.Tensor]) -> t.Tensor:
+    """Final norm + unembedding for many layers' residuals as one batched op.
+
+    Concatenates the residuals along the batch dim so ``ln_f`` and
+    ``lm_head`` run once (one GEMM) instead of once per layer.
+
+    Args:
+        model: Wrapper whose ``model.ln_f`` / ``lm_head`` do the projection.
+        hiddens: Per-layer residuals, each ``[1, ..., D]``. Moved to the last
+            layer's device first, since ``device_map="auto"`` can spread
+            layers across GPUs.
+
+    Returns:
+        ``[len(hiddens), ..., V]`` logits.
+    """
+    device = hiddens[-1].device
+    hidden_ND = t.cat([hs.to(device) for hs in hiddens], dim=0)
+    return model.lm_head(model.model.ln_f(hidden_ND))
+
+
+def rank_of(logits: t.Tensor, target_ids: t.Tensor) -> t.Tensor:
+    """1-based rank of ``target_ids`` within ``logits`` along the vocab dim.
+
+    Rank is one plus the number of strictly larger logits. Softmax is
+    monotonic, so this is the rank by probability, without an O(V log V)
+    sort or a V-sized rank map.
+
+    Ties share the best (lowest) rank: two tokens with equal logits both
+    rank above every smaller one. The old descending ``argsort`` ranks
+    agree wherever the target has no tie; on a tie they depended on the
+    sort's arbitrary order, so a tied target could rank one or more places
+    lower there. Ties are common in bf16.
+
+    Args:
+        logits: ``[..., V]`` logits.
+        target_ids: ``[..., X]`` token ids to rank, with the same leading
+            dims as ``logits``.
+
+    Returns:
+        ``[..., X]`` int64 ranks.
+    """
+    target_logits = logits.gather(-1, target_ids)
+    return (logits.unsqueeze(-2) > target_logits.unsqueeze(-1)).sum(dim=-1) + 1
+
+
+def layer_lens_reductions(
+    project,
+    hiddens: list[t.Tensor],
+    final_logits: t.Tensor | None = None,
+    *,
+    top_k: int = 0,
+    target_ids: t.Tensor | None = None,
+    entropy: bool = False,
+    gather_ids: t.Tensor | None = None,
+    tile_rows: int = LENS_TILE_ROWS,
+) -> dict[str, t.Tensor]:
+    """Project per-layer residuals onto the vocabulary tile by tile, keeping
+    only the requested reductions.
+
+    The ``[L, T, V]`` logits tensor is never materialized: (layer, position)
+    rows are projected ``tile_rows`` at a time and each tile is reduced
+    before the next one is built. When every row fits in one tile this is a
+    single GEMM, same as ``project_on_vocab``.
+
+    Args:
+        project: Maps ``[N, D]`` residual rows to ``[N, V]`` logits (e.g.
+            ``model.project_on_vocab``).
+        hiddens: Per-layer residuals, each ``[1, T, D]``.
+        final_logits: Optional ``[1, T, V]`` logits appended as the last
+            layer as-is (the model's own output, rather than a projection).
+        top_k: Keep the ``top_k`` highest-probability ids and their
+            probabilities (``top_ids`` / ``top_probs``, ``[L, T, k]``).
+        target_ids: ``[T]`` id per position; keep its probability and rank
+            at every layer (``target_probs`` / ``target_ranks``, ``[L, T]``).
+        entropy: Keep the entropy of each row (``entropy``, ``[L, T]``).
+        gather_ids: ``[T, U]`` ids per position; keep their probabilities
+            at every layer (``gathered_probs``, ``[L, T, U]``).
+        tile_rows: Rows projected per tile.
+
+    Returns:
+        The requested reductions keyed as above. Probabilities and entropy
+        are float32; ids and ranks are int64.
+    """
+    sources = []
+    if hiddens:
+        device = hiddens[-1].device
+        sources.append((project, t.cat([hs[0].to(device) for hs in hiddens], dim=0)))
+    if final_logits is not None:
+        sources.append((None, final_logits[0]))
+
+    n_layers = len(hiddens) + (final_logits is not None)
+    n_pos = sources[0][1].shape[0] // (len(hiddens) or 1)
+
+    parts: dict[str, list[t.Tensor]] = {}
+    for project_tile, rows in sources:
+        for start in range(0, rows.shape[0], tile_rows):
+            tile = rows[start:start + tile_rows]
+            logits_NV = tile if project_tile is None else project_tile(tile)
+            pos_N = t.arange(start, start + tile.shape[0], device=logits_NV.device) % n_pos
+
+            reduced = _reduce_tile(
+                logits_NV,
+                pos_N,
+                top_k=top_k,
+                target_ids=target_ids,
+                entropy=entropy,
+                gather_ids=gather_ids,
+            )
+            for key, value in reduced.items():
+                parts.setdefault(key, []).append(value)
+            del logits_NV
+
+    return {
+        key: t.cat(chunks, dim=0).reshape(n_layers, n_pos, *chunks[0].shape[1:])
+        for key, chunks in parts.items()
+    }
+
+
+def union_ids_per_position(top_ids: t.Tensor) -> t.Tensor:
+    """Union of each position's top-k ids across all layers.
+
+    Args:
+        top_ids: ``[L, T, k]`` ids from ``layer_lens_reductions(top_k=k)``.
+
+    Returns:
+        ``[T, U]`` sorted unique ids per position, where ``U`` is the largest
+        union size. Shorter rows are padded by repeating their first id, so
+        gathering through the padding only yields duplicate values.
+    """
+    ids_TX, _ = top_ids.permute(1, 0, 2).flatten(start_dim=1).sort(dim=1)
+
+    # First occurrence of each id in its sorted row; a stable sort on the
+    # "is a repeat" flag moves those to the front, still in ascending order.
+    first_TX = t.ones_like(ids_TX, dtype=t.bool)
+    first_TX[:, 1:] = ids_TX[:, 1:] != ids_TX[:, :-1]
+    n_unique_T = first_TX.sum(dim=1)
+    order_TX = (~first_TX).to(t.uint8).argsort(dim=1, stable=True)
+
+    unique_TU = ids_TX.gather(1, order_TX)[:, :int(n_unique_T.max())]
+    valid_TU = t.arange(unique_TU.shape[1], device=unique_TU.device) < n_unique_T[:, None]
+    return t.where(valid_TU, unique_TU, unique_TU[:, :1])
+
+
+def _reduce_tile(
+    logits_NV: t.Tensor,
+    pos_N: t.Tensor,
+    *,
+    top_k: int,
+    target_ids: t.Tensor | None,
+    entropy: bool,
+    gather_ids: t.Tensor | None,
+) -> dict[str, t.Tensor]:
+    """Reduce one ``[N, V]`` tile of logits; ``pos_N`` is each row's position."""
+    reduced = {}
+    log_p_NV = t.nn.functional.log_softmax(logits_NV.float(), dim=-1)
+
+    if top_k:
+        _, top_ids_NK = logits_NV.topk(top_k, dim=-1)
+        reduced["top_ids"] = top_ids_NK
+        reduced["top_probs"] = log_p_NV.gather(-1, top_ids_NK).exp()
+
+    if target_ids is not None:
+        target_N1 = target_ids.to(logits_NV.device)[pos_N].unsqueeze(-1)
+        reduced["target_probs"] = log_p_NV.gather(-1, target_N1).exp().squeeze(-1)
+        reduced["target_ranks"] = rank_of(logits_NV, target_N1).squeeze(-1)
+
+    if gather_ids is not None:
+        ids_NU = gather_ids.to(logits_NV.device)[pos_N]
+        reduced["gathered_probs"] = log_p_NV.gather(-1, ids_NU).exp()
+
+    if entropy:
+        # p * log p, reusing the exp() buffer.
+        reduced["entropy"] = -log_p_NV.exp().mul_(log_p_NV).sum(dim=-1)
+
+    return reduced
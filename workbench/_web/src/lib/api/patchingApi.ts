@@ -0,0 +1,30 @@
+/**
+ * Patching API - Patch grid requests (exact or attribution-estimated)
+ */
+
+import config from "@/lib/config";
+import { PatchingConfig, PatchGridData } from "@/types/patching";
+import { startAndPoll } from "../startAndPoll";
+import { createUserHeadersAction } from "@/actions/auth";
+
+/**
+ * Fetch a patch grid from the backend.
+ *
+ * Goes through /patch/start-grid and /patch/results-grid, so it runs on NDIF
+ * in remote deployments and returns the grid directly when local.
+ */
+export const getPatchGrid = async (patchingConfig: PatchingConfig): Promise<PatchGridData> => {
+    const headers = await createUserHeadersAction();
+
+    const request: PatchingConfig = {
+        ...patchingConfig,
+        approximate: patchingConfig.approximate ?? false,
+    };
+
+    return await startAndPoll<PatchGridData>(
+        config.endpoints.startPatchGrid,
+        request,
+        config.endpoints.resultsPatchGrid,
+        headers,
+    );
+};
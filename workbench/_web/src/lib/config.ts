@@ -22,6 +22,9 @@ const config = {
         startCausalMediation: "/causal_mediation/start",
         resultsCausalMediation: (jobId: string) => `/causal_mediation/results/${jobId}`,
 
+        startPatchGrid: "/patch/start-grid",
+        resultsPatchGrid: (jobId: string) => `/patch/results-grid/${jobId}`,
+
         startActivationPatching: "/activation_patching/start",
         resultsActivationPatching: (jobId: string) => `/activation_patching/results/${jobId}`,
 
@@ -21,4 +21,15 @@ export interface PatchingConfig {
     correctId: number;
     incorrectId: number | undefined;
     patchTokens: boolean;
+    // Estimate the grid by attribution patching (one backward pass) rather
+    // than patching every cell exactly.
+    approximate?: boolean;
+}
+
+export interface PatchGridData {
+    results: number[][];
+    rowLabels: (string | number)[];
+    colLabels: (string | number)[];
+    // True when `results` are first-order estimates, not exact patches.
+    approximate: boolean;
 }